@@ -1,31 +1,63 @@
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from 语料工具 import map_ordered
 
-def clean_data(input_file, output_file):
+# ======= 配置参数 =======
+FIELDS = ["category", "title", "desc", "answer", "content", "内容"]  # 需要提取的字段，按顺序每个字段写一行
+SKIP_EMPTY = True     # 跳过空字段和记录之间的空行，减少后续预处理需要读取的数据量
+WORKERS = os.cpu_count() or 1  # 解析进程数，1 表示单进程
+BATCH_SIZE = 10000    # 每个进程一次解析的行数
+
+def extract_fields(lines, fields=FIELDS, skip_empty=SKIP_EMPTY):
+    """解析一批 JSONL 行，返回 (输出文本, 错误信息列表)。"""
+    output = []
+    errors = []
+    for line in lines:
+        try:
+            data = json.loads(line)  # 逐行解析
+            if skip_empty:
+                for field in fields:
+                    value = data.get(field)
+                    if value is not None and f"{value}".strip():
+                        output.append(f"{value}\n")
+            else:
+                values = [f"{data.get(field, '')}" for field in fields]
+                # 写入数据到输出文件，每个字段的内容一行，每个记录之间加一空行
+                output.extend(value + "\n" for value in values)
+                output.append("\n")
+        except json.JSONDecodeError as e:
+            errors.append(f"JSONDecodeError: {e} - in line: {line}")
+        except Exception as e:
+            errors.append(f"Error: {e}")
+    return "".join(output), errors
+
+def _extract_task(task):
+    """子进程任务，参数打包成元组以便提交到进程池。"""
+    return extract_fields(*task)
+
+def clean_data(input_file, output_file, fields=FIELDS, skip_empty=SKIP_EMPTY, workers=WORKERS, batch_size=BATCH_SIZE):
     with open(input_file, 'r', encoding='utf-8') as infile:
         with open(output_file, 'w', encoding='utf-8') as outfile:
-            for line in infile:
-                try:
-                    data = json.loads(line)  # 逐行解析
-                    category = data.get("category", "")
-                    title = data.get("title", "")
-                    desc = data.get("desc", "")
-                    answer = data.get("answer", "")
-                    content = data.get("content", "")    
-                    内容 = data.get("内容", "")   
-                    
-                    # 写入数据到输出文件，每个字段的内容一行
-                    outfile.write(f"{category}\n")
-                    outfile.write(f"{title}\n")
-                    outfile.write(f"{desc}\n")
-                    outfile.write(f"{answer}\n")
-                    outfile.write(f"{content}\n")
-                    outfile.write(f"{内容}\n")                    
-                    outfile.write("\n")  # 每个记录之间加一空行
-
-                except json.JSONDecodeError as e:
-                    print(f"JSONDecodeError: {e} - in line: {line}")
-                except Exception as e:
-                    print(f"Error: {e}")
+            batches = iter(lambda: list(islice(infile, batch_size)), [])
+
+            if workers <= 1:
+                for lines in batches:
+                    text, errors = extract_fields(lines, fields, skip_empty)
+                    outfile.write(text)
+                    for error in errors:
+                        print(error)
+                return
+
+            # 多进程按块解析，按提交顺序取回结果，输出顺序与单进程一致
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                tasks = ((lines, fields, skip_empty) for lines in batches)
+                for text, errors in map_ordered(executor, _extract_task, tasks, workers * 2):
+                    outfile.write(text)
+                    for error in errors:
+                        print(error)
+
 if __name__ == "__main__":
     input_file = "语料输入/news.json"  # 输入文件路径
     output_file = "语料输入/news.txt"     # 输出文件路径
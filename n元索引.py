@@ -0,0 +1,325 @@
+"""
+n-gram 二进制索引：把 ARPA 文件编译成可内存映射的紧凑格式，按需查询概率
+
+查询模型原本只能重新解析文本格式的 log.arpa，再把几千万条 n-gram 装进字典。
+这里把 ARPA 编译成一个二进制文件，打开时只做 mmap，不把模型读进内存：
+  词表      按码位排序的 UTF-8 字符串拼接 + 偏移数组，词的编号即排序后的序号，二分查找
+  各阶记录  按词编号元组排序的 uint32 数组（每条 n 个编号），配套 float32 的对数概率和回退权重
+查询 p(w | 上下文) 时对每一阶做二分查找，复杂度 O(log n)，找不到时按 ARPA 的回退规则逐阶缩短上下文。
+概率与 ARPA 文件相同，为以 10 为底的对数。
+
+用法：python n元索引.py build log.arpa log.arpa.idx
+      python n元索引.py query log.arpa.idx [上下文词 ...] 词
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from tqdm import tqdm
+from 语料工具 import open_corpus
+
+INDEX_MAGIC = b'LMDGNGI1'
+UNK_TOKEN = '<unk>'
+
+# 文件头：魔数、字节序（0 小端 / 1 大端）、阶数、词表大小、词表偏移，之后每阶一组 (条数, 编号偏移, 概率偏移, 回退偏移)
+_HEADER = struct.Struct('<8sBBxxIQ')
+_ORDER_HEADER = struct.Struct('<QQQQ')
+_ALIGN = 8
+_MAX_ORDER = 255  # 文件头中阶数占 1 字节
+
+# ========== 读取 ARPA ==========
+def iter_arpa_sections(arpa_file):
+    """逐阶返回 (阶数, 记录迭代器)，记录为 (对数概率, 词列表, 回退权重)；没有回退权重时为 0.0。
+
+    必须按顺序消费：取下一阶之前要先把上一阶的记录读完。
+    """
+    with open_corpus(arpa_file) as file:
+        line = ''
+        for line in file:
+            if line.startswith('\\') and '-grams:' in line:
+                break
+        while line.startswith('\\') and '-grams:' in line:
+            order = int(line.split('-')[0][1:])
+            section = _SectionEntries(file)
+            yield order, section
+            for _ in section:  # 调用方没读完时跳过剩余部分
+                pass
+            line = section.next_header
+
+class _SectionEntries:
+    """一阶的记录迭代器，遇到下一个以 '\\' 开头的行时停止，并把该行留在 next_header 中。"""
+
+    def __init__(self, file):
+        self.file = file
+        self.next_header = ''
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.done:
+            raise StopIteration
+        for line in self.file:
+            if line[:1] == '\\':
+                self.next_header = line
+                break
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 2 or not parts[1].strip():
+                continue
+            backoff = float(parts[2]) if len(parts) > 2 and parts[2] else 0.0
+            return float(parts[0]), parts[1].split(), backoff
+        self.done = True
+        raise StopIteration
+
+# ========== 编译索引 ==========
+def _pad(f):
+    """把写入位置补齐到 _ALIGN 字节，便于 memoryview 按元素类型直接转换。"""
+    remainder = f.tell() % _ALIGN
+    if remainder:
+        f.write(b'\0' * (_ALIGN - remainder))
+    return f.tell()
+
+def build_index(arpa_file, index_file):
+    """把 ARPA 文件编译成二进制索引，返回各阶条数。
+
+    每阶在内存中排序一次（编号元组压成一个整数后排序），峰值内存与条数最多的一阶成正比。
+    """
+    if array('I').itemsize != 4 or array('f').itemsize != 4:
+        raise RuntimeError("当前平台的 array('I') / array('f') 不是 4 字节，无法生成索引")
+    tmp_file = index_file + '.tmp'
+    vocab = None
+    sections = []
+    with open(tmp_file, 'wb') as f:
+        f.seek(_HEADER.size + _ORDER_HEADER.size * _MAX_ORDER)  # 文件头最后回填，先按最大阶数预留位置
+        for order, entries in iter_arpa_sections(arpa_file):
+            if order != len(sections) + 1:
+                raise ValueError(f"ARPA 文件的阶数不连续：在第 {len(sections)} 阶之后出现 {order} 阶")
+            if order == 1:
+                vocab, section = _write_unigrams(f, entries)
+            else:
+                section = _write_ngrams(f, order, entries, vocab)
+            sections.append(section)
+            print(f"{order}-gram 已写入索引：{section[0]} 条")
+        if vocab is None:
+            raise ValueError(f"{arpa_file} 中没有 1-gram")
+        vocab_offset = _pad(f)
+        offsets = array('Q', [0])
+        blob = bytearray()
+        for word in vocab:
+            blob += word.encode('utf-8')
+            offsets.append(len(blob))
+        f.write(offsets.tobytes())
+        f.write(blob)
+
+        f.seek(0)
+        f.write(_HEADER.pack(INDEX_MAGIC, sys.byteorder == 'big', len(sections), len(vocab), vocab_offset))
+        for section in sections:
+            f.write(_ORDER_HEADER.pack(*section))
+    os.replace(tmp_file, index_file)
+    print(f"索引已生成：{index_file}（{len(vocab)} 个词，{os.path.getsize(index_file) / 1024 / 1024:.1f} MB）")
+    return [section[0] for section in sections]
+
+def _write_unigrams(f, entries):
+    """1 阶：词表按码位排序（与 UTF-8 字节序一致），编号即序号。"""
+    records = sorted((words[0], logprob, backoff) for logprob, words, backoff in entries if len(words) == 1)
+    vocab = {word: i for i, (word, _, _) in enumerate(records)}
+    ids_offset = _pad(f)
+    f.write(array('I', range(len(records))).tobytes())
+    prob_offset = _pad(f)
+    f.write(array('f', [logprob for _, logprob, _ in records]).tobytes())
+    backoff_offset = _pad(f)
+    f.write(array('f', [backoff for _, _, backoff in records]).tobytes())
+    return vocab, (len(records), ids_offset, prob_offset, backoff_offset)
+
+def _write_ngrams(f, order, entries, vocab, block=1 << 20):
+    """n 阶：编号元组以词表大小为基压成一个整数，再乘上条数加上原位置，一次排序同时得到顺序和原位置。"""
+    base = len(vocab)
+    keys, logprobs, backoffs = [], array('f'), array('f')
+    for logprob, words, backoff in tqdm(entries, desc=f"读取 {order}-gram"):
+        if len(words) != order:
+            continue
+        key = 0
+        try:
+            for word in words:
+                key = key * base + vocab[word]
+        except KeyError as e:
+            raise ValueError(f"{order}-gram {' '.join(words)} 中的词 {e.args[0]} 不在 1-gram 中") from None
+        keys.append(key)
+        logprobs.append(logprob)
+        backoffs.append(backoff)
+    count = len(keys)
+    for i in range(count):
+        keys[i] = keys[i] * count + i
+    keys.sort()
+
+    ids_offset = _pad(f)
+    for start in range(0, count, block):
+        ids = array('I')
+        for key in keys[start:start + block]:
+            key //= count
+            row = []
+            for _ in range(order):
+                key, word_id = divmod(key, base)
+                row.append(word_id)
+            ids.extend(reversed(row))
+        f.write(ids.tobytes())
+    prob_offset = _pad(f)
+    for start in range(0, count, block):
+        f.write(array('f', [logprobs[key % count] for key in keys[start:start + block]]).tobytes())
+    backoff_offset = _pad(f)
+    for start in range(0, count, block):
+        f.write(array('f', [backoffs[key % count] for key in keys[start:start + block]]).tobytes())
+    return count, ids_offset, prob_offset, backoff_offset
+
+# ========== 查询 ==========
+class _Vocab:
+    """按序号取词表中的词（UTF-8 字节串，字节序与码位序一致），供 bisect 二分查找。"""
+
+    def __init__(self, data, offsets, blob_offset):
+        self.data = data            # mmap 切片直接得到 bytes，比 memoryview 解码快
+        self.offsets = offsets
+        self.blob_offset = blob_offset
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.blob_offset + self.offsets[i]:self.blob_offset + self.offsets[i + 1]]
+
+class _Rows:
+    """把 n 阶编号数组按行看作编号列表的序列，供 bisect 二分查找。"""
+
+    def __init__(self, ids, order):
+        self.ids = ids
+        self.order = order
+
+    def __len__(self):
+        return len(self.ids) // self.order
+
+    def __getitem__(self, i):
+        return self.ids[i * self.order:(i + 1) * self.order].tolist()
+
+class NgramIndex:
+    """内存映射的 n-gram 索引，概率为以 10 为底的对数（与 ARPA 相同）。"""
+
+    def __init__(self, index_file):
+        with open(index_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, big_endian, order, vocab_size, vocab_offset = _HEADER.unpack_from(view)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_file} 不是 n-gram 索引文件")
+        if big_endian != (sys.byteorder == 'big'):
+            raise ValueError(f"{index_file} 由字节序不同的平台生成，请重新编译")
+        self.order = order
+        self.counts = []
+        self._rows, self._logprobs, self._backoffs = [], [], []
+        for n in range(1, order + 1):
+            count, ids_offset, prob_offset, backoff_offset = _ORDER_HEADER.unpack_from(
+                view, _HEADER.size + _ORDER_HEADER.size * (n - 1))
+            self.counts.append(count)
+            self._rows.append(_Rows(view[ids_offset:ids_offset + 4 * n * count].cast('I'), n))
+            self._logprobs.append(view[prob_offset:prob_offset + 4 * count].cast('f'))
+            self._backoffs.append(view[backoff_offset:backoff_offset + 4 * count].cast('f'))
+        offsets = view[vocab_offset:vocab_offset + 8 * (vocab_size + 1)].cast('Q')
+        blob_offset = vocab_offset + 8 * (vocab_size + 1)
+        self._vocab = _Vocab(self._mmap, offsets, blob_offset)
+        self.unk_id = self.word_id(UNK_TOKEN)
+
+    def close(self):
+        self._vocab = self._rows = self._logprobs = self._backoffs = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def word_id(self, word):
+        """词的编号，不在词表中返回 None。"""
+        word = word.encode('utf-8')
+        i = bisect_left(self._vocab, word)
+        return i if i < len(self._vocab) and self._vocab[i] == word else None
+
+    def _find(self, ids):
+        """编号列表在对应阶中的位置，不存在返回 None。"""
+        rows = self._rows[len(ids) - 1]
+        i = bisect_left(rows, ids)
+        return i if i < len(rows) and rows[i] == ids else None
+
+    def _ids(self, words):
+        ids = []
+        for word in words:
+            word_id = self.word_id(word)
+            if word_id is None:
+                word_id = self.unk_id
+                if word_id is None:
+                    raise KeyError(f"词 {word} 不在词表中，且模型没有 {UNK_TOKEN}")
+            ids.append(word_id)
+        return ids
+
+    def entry(self, words):
+        """n-gram 在模型中的 (对数概率, 回退权重)，不存在返回 None；words 为词列表或以空格分隔的字符串。"""
+        if isinstance(words, str):
+            words = words.split()
+        if not 0 < len(words) <= self.order:
+            return None
+        ids = [self.word_id(word) for word in words]
+        if None in ids:
+            return None
+        i = self._find(ids)
+        if i is None:
+            return None
+        n = len(ids) - 1
+        return self._logprobs[n][i], self._backoffs[n][i]
+
+    def log_prob(self, word, context=()):
+        """log10 p(word | context)；context 为前文词列表（按出现顺序）或以空格分隔的字符串，只用最后 order - 1 个词。
+
+        上下文加上 word 不在模型中时，累加上下文的回退权重并去掉最早的一个词重试，直到 1 阶。
+        不在词表中的词按 <unk> 处理。
+        """
+        context = context.split() if isinstance(context, str) else list(context)
+        context_ids = self._ids(context[max(0, len(context) - self.order + 1):] if self.order > 1 else [])
+        word_ids = self._ids([word])
+        backoff = 0.0
+        for start in range(len(context_ids) + 1):
+            i = self._find(context_ids[start:] + word_ids)
+            if i is not None:
+                return backoff + self._logprobs[len(context_ids) - start][i]
+            j = self._find(context_ids[start:])
+            if j is not None:
+                backoff += self._backoffs[len(context_ids) - start - 1][j]
+        raise AssertionError("1-gram 必然存在")  # word_ids 来自词表，不会走到这里
+
+    def prob(self, word, context=()):
+        """p(word | context)。"""
+        return 10 ** self.log_prob(word, context)
+
+# ========== 命令行 ==========
+def main():
+    parser = argparse.ArgumentParser(description="ARPA 模型的二进制 n-gram 索引")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="把 ARPA 文件编译成索引")
+    build.add_argument('arpa_file')
+    build.add_argument('index_file')
+    query = commands.add_parser('query', help="查询 log10 p(词 | 上下文)")
+    query.add_argument('index_file')
+    query.add_argument('words', nargs='+', help="上下文词 ... 词")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args.arpa_file, args.index_file)
+    else:
+        with NgramIndex(args.index_file) as index:
+            *context, word = args.words
+            logprob = index.log_prob(word, context)
+            print(f"log10 p({word} | {' '.join(context)}) = {logprob:.6f}  p = {10 ** logprob:.6g}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+内建 n-gram 计数：直接从分词结果统计 1..N 阶 n-gram 的精确频次
+
+原流程先用 lmplz 生成 ARPA，再用 round(概率 * 总数) 把概率换算回近似频次，既有损又慢。
+这里流式读取 分词后.txt，每句前后补 <s> / </s>（与 lmplz 一致，后续 merge_ngram_files 照常处理），
+各阶计数放在内存哈希表中，条目数超过上限时排序后落盘为有序的 run 文件；
+最后对每一阶的 run 做多路归并、累加相同 n-gram，内存只与 run 的个数有关。
+输出与 write_frequencies_to_file 格式相同（n-gram\t频次），按 n-gram 排序，不依赖 KenLM。
+"""
+import heapq
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from itertools import islice, chain
+from tqdm import tqdm
+from 语料工具 import open_corpus
+
+SPILL_ENTRIES = 5_000_000  # 内存中各阶计数的总条目数超过此值时落盘
+BATCH_LINES = 10000        # 每次批量计数的行数
+MERGE_FAN_IN = 256         # 一次多路归并最多同时打开的 run 个数，超过时先分组归并成更大的 run
+
+def sentence_ngrams(words, n):
+    """返回一句话（已补 <s> / </s>）中所有 n 阶 n-gram 的迭代器，词之间以空格分隔。"""
+    if n == 1:
+        return iter(words)
+    return map(' '.join, zip(*(words[i:] for i in range(n))))
+
+def count_lines(lines, counters):
+    """把一批分词后的行计入 counters（counters[n - 1] 为 n 阶计数）。"""
+    sentences = [['<s>', *line.split(), '</s>'] for line in lines]
+    for n, counter in enumerate(counters, 1):
+        counter.update(chain.from_iterable(sentence_ngrams(words, n) for words in sentences))
+
+def spill_run(counter, tag, run_dir, runs):
+    """把计数按键排序后写成一个 run 文件（文件名以 tag 开头），路径追加到 runs，并清空计数。"""
+    path = os.path.join(run_dir, f'{tag}.{len(runs)}.run')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{ngram}\t{count}\n" for ngram, count in sorted(counter.items()))
+    runs.append(path)
+    counter.clear()
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            ngram, count = line.rstrip('\n').rsplit('\t', 1)
+            yield ngram, int(count)
+
+def merge_runs(paths):
+    """多路归并若干有序 run，相同键的频次累加，按键的顺序逐个返回 (键, 频次)。"""
+    current, total = None, 0
+    for ngram, count in heapq.merge(*(_read_run(path) for path in paths)):
+        if ngram != current:
+            if current is not None:
+                yield current, total
+            current, total = ngram, 0
+        total += count
+    if current is not None:
+        yield current, total
+
+def compact_runs(runs, tag, run_dir, fan_in=MERGE_FAN_IN):
+    """run 个数超过 fan_in 时，每 fan_in 个归并成一个新 run，直到不超过 fan_in，避免同时打开过多文件。"""
+    level = 0
+    while len(runs) > fan_in:
+        level += 1
+        merged = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start + fan_in]
+            path = os.path.join(run_dir, f'{tag}.L{level}.{len(merged)}.run')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(f"{key}\t{count}\n" for key, count in merge_runs(group))
+            for old in group:
+                os.remove(old)
+            merged.append(path)
+        runs[:] = merged
+
+class RunCounter:
+    """超过 spill_entries 个键时排序落盘的计数器：add 累加频次，items() 按键的顺序返回累加后的 (键, 频次)。"""
+
+    def __init__(self, run_dir, tag, spill_entries=SPILL_ENTRIES):
+        self.counts = defaultdict(int)
+        self.runs = []
+        self.run_dir = run_dir
+        self.tag = tag
+        self.spill_entries = spill_entries
+
+    def add(self, key, count):
+        counts = self.counts
+        counts[key] += count
+        if len(counts) >= self.spill_entries:
+            spill_run(counts, self.tag, self.run_dir, self.runs)
+
+    def items(self):
+        """只能调用一次；有 run 时剩余计数也落盘，统一多路归并。"""
+        if not self.runs:
+            return iter(sorted(self.counts.items()))
+        if self.counts:
+            spill_run(self.counts, self.tag, self.run_dir, self.runs)
+        compact_runs(self.runs, self.tag, self.run_dir)
+        return merge_runs(self.runs)
+
+def count_ngrams(segmented_file, filename_template, ngram_order=3, prune=(), spill_entries=SPILL_ENTRIES,
+                 tmp_dir=None, batch_lines=BATCH_LINES, full_template=None):
+    """统计分词文件中 1..ngram_order 阶 n-gram 的精确频次，按阶写入 filename_template.format(n)。
+
+    prune 与 lmplz --prune 含义相同：prune[n - 1] 为 n 阶的阈值，频次不大于阈值的 n-gram 被丢弃，
+    0 或未给出表示不过滤；与 lmplz 一样，1 阶的阈值必须为 0。
+    给出 full_template 时，在同一遍归并中把未剪枝的全部频次另外写入 full_template.format(n)。
+    """
+    if prune and prune[0] != 0:
+        raise ValueError("1 阶 n-gram 不能剪枝，prune 的第一个值必须为 0")
+    thresholds = list(prune)[:ngram_order] + [0] * (ngram_order - len(prune))
+    counters = [Counter() for _ in range(ngram_order)]
+    run_files = [[] for _ in range(ngram_order)]
+    run_dir = tempfile.mkdtemp(prefix='ngram_runs_', dir=tmp_dir)
+    try:
+        with open_corpus(segmented_file) as f_in:
+            batches = iter(lambda: list(islice(f_in, batch_lines)), [])
+            for lines in tqdm(batches, desc=f"统计 1-{ngram_order} 阶 n-gram（每批 {batch_lines} 行）"):
+                count_lines(lines, counters)
+                if sum(map(len, counters)) >= spill_entries:
+                    for n, counter in enumerate(counters, 1):
+                        if counter:
+                            spill_run(counter, n, run_dir, run_files[n - 1])
+
+        for n in range(1, ngram_order + 1):
+            counter = counters[n - 1]
+            if run_files[n - 1]:
+                if counter:
+                    spill_run(counter, n, run_dir, run_files[n - 1])  # 剩余计数也落盘后统一归并
+                compact_runs(run_files[n - 1], n, run_dir)
+                items = merge_runs(run_files[n - 1])
+            else:
+                items = iter(sorted(counter.items()))
+            filename = filename_template.format(n)
+            kept = total = 0
+            with open_corpus(filename, 'w') as f_out, \
+                    (open_corpus(full_template.format(n), 'w') if full_template else nullcontext()) as f_full:
+                for ngram, count in items:
+                    line = f"{ngram}\t{count}\n"
+                    total += 1
+                    if f_full is not None:
+                        f_full.write(line)
+                    if count > thresholds[n - 1]:
+                        f_out.write(line)
+                        kept += 1
+            counter.clear()
+            print(f"{n}-gram 写入 {filename}：{kept} 条（{len(run_files[n - 1])} 个 run）")
+            if full_template:
+                print(f"{n}-gram 未剪枝频次写入 {full_template.format(n)}：{total} 条")
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
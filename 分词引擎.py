@@ -0,0 +1,249 @@
+"""
+多进程分词引擎，供 内建多线程分词.py 和 系统多线程分词.py 共用
+
+jieba.enable_parallel 派生的子进程不会带上自定义词典，线程池又受 GIL 限制，
+这里改用进程池：每个进程只加载一次 jieba 主词典、全部自定义词典和 OpenCC，
+主进程按块分发行，并按顺序写回结果。fork 启动时先在主进程加载，子进程写时复制直接继承。
+"""
+import os
+import marshal
+import tempfile
+import hashlib
+import jieba
+import jieba.finalseg
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from 繁简转换 import BatchConverter
+from 词典分词 import DagSegmenter
+from 语料工具 import open_corpus, map_ordered, split_file_shards, read_shard_lines, compression_of, file_digest
+
+BATCH_SIZE = 2000  # 压缩文件无法按字节切分，由主进程读出后每次分发给子进程的行数
+SHARD_SIZE = 16 * 1024 * 1024  # 未压缩文件按行对齐切成的分片大小（字节），子进程自行读取
+SEG_MODES = ('precise', 'full', 'search')
+# hmm=None 时各模式的默认 HMM 开关，与原脚本的调用方式一致（全模式下 jieba 不使用 HMM）
+DEFAULT_HMM = {'precise': False, 'full': True, 'search': True}
+DICT_CACHE_DIR = '词典缓存'  # 合并后的前缀词典缓存目录，None 表示不缓存
+SEG_BACKENDS = ('jieba', 'native')  # native 为 词典分词.py 中基于项目词表的 DAG 分词（不支持 HMM）
+
+_loaded_dict = None
+_opencc = None
+_native = None
+_pool_workers = 1  # 最近一次 create_pool 的进程数，segment_files 据此限制在途任务数
+
+# ========== 自定义词典 ==========
+def custom_dict_files(custom_dict_dir):
+    """返回要加载的自定义词典文件列表，按文件名排序，保证加载顺序（同词以后加载的为准）稳定。"""
+    if os.path.isdir(custom_dict_dir):
+        return [os.path.join(custom_dict_dir, filename) for filename in sorted(os.listdir(custom_dict_dir))
+                if os.path.isfile(os.path.join(custom_dict_dir, filename))]
+    if os.path.isfile(custom_dict_dir):
+        return [custom_dict_dir]
+    return []
+
+def dict_cache_key(dict_files):
+    """由 jieba 版本、主词典和各自定义词典的内容摘要计算缓存键，任一词典变化都会重新构建。"""
+    key = hashlib.blake2b(digest_size=16)
+    key.update(jieba.__version__.encode('utf-8'))
+    if jieba.dt.dictionary:  # 使用了自定义主词典
+        key.update(file_digest(jieba.dt.dictionary).encode('utf-8'))
+    for dict_path in dict_files:
+        key.update(os.path.basename(dict_path).encode('utf-8'))
+        key.update(file_digest(dict_path).encode('utf-8'))
+    return key.hexdigest()
+
+def _load_dict_cache(cache_file):
+    """从缓存恢复合并后的前缀词典，成功返回 True。"""
+    try:
+        with open(cache_file, 'rb') as f:
+            freq, total, word_tags, force_split = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return False
+    jieba.dt.FREQ, jieba.dt.total = freq, total
+    jieba.dt.user_word_tag_tab.update(word_tags)
+    jieba.dt.initialized = True
+    jieba.finalseg.Force_Split_Words.update(force_split)
+    return True
+
+def _save_dict_cache(cache_file):
+    """把加载完自定义词典后的前缀词典写入缓存，先写临时文件再原子替换。"""
+    cache_dir = os.path.dirname(cache_file) or '.'
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        marshal.dump((jieba.dt.FREQ, jieba.dt.total, jieba.dt.user_word_tag_tab,
+                      set(jieba.finalseg.Force_Split_Words)), f)
+    os.replace(tmp_path, cache_file)
+
+# 加载自定义词典
+def load_custom_dict(custom_dict_dir, cache_dir=DICT_CACHE_DIR):
+    """加载全部自定义词典。
+
+    大词表逐行解析很慢，首次加载后把合并好的前缀词典用 marshal 序列化到 cache_dir，
+    以后（包括 spawn 启动的子进程）直接反序列化，不再解析文本词典。
+    """
+    dict_files = custom_dict_files(custom_dict_dir)
+    if not dict_files:
+        print(f"路径 '{custom_dict_dir}' 无效，请检查。")
+        jieba.initialize()
+        return
+
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, f"jieba_user.{dict_cache_key(dict_files)}.cache")
+        if _load_dict_cache(cache_file):
+            print(f"已从缓存加载自定义词典：{cache_file}（{len(dict_files)} 个词典文件）")
+            return
+
+    jieba.initialize()
+    for dict_path in dict_files:
+        jieba.load_userdict(dict_path)
+        print(f"已加载自定义词典：{dict_path}")
+    if cache_file:
+        _save_dict_cache(cache_file)
+        print(f"自定义词典缓存已写入：{cache_file}")
+
+# ========== 进程池分词 ==========
+def init_worker(custom_dict_dir, backend='jieba', lexicon_files=()):
+    """每个进程只执行一次：加载分词词典（jieba 或 native 词表）、创建 OpenCC 实例。
+
+    native 后端的词表为 lexicon_files 加上 custom_dict_dir 中的自定义词典。
+    """
+    global _loaded_dict, _opencc, _native
+    if backend not in SEG_BACKENDS:
+        raise ValueError(f"未知的分词后端: {backend}，请选择 {' / '.join(SEG_BACKENDS)}")
+    if _opencc is None:
+        _opencc = BatchConverter('t2s')
+    dict_key = (custom_dict_dir, backend, tuple(lexicon_files))
+    if _loaded_dict != dict_key:
+        if backend == 'native':
+            _native = DagSegmenter.load(list(lexicon_files) + custom_dict_files(custom_dict_dir), DICT_CACHE_DIR)
+        else:
+            _native = None
+            load_custom_dict(custom_dict_dir)
+        _loaded_dict = dict_key
+
+def cut_line(line, mode='precise', hmm=None):
+    """按分词模式切分一行，返回词的迭代器；hmm 为 None 时使用该模式的默认值，native 后端忽略 hmm。"""
+    if _native is not None:
+        return _native.cut(line, mode)
+    if hmm is None:
+        hmm = DEFAULT_HMM.get(mode, False)
+    if mode == 'precise':
+        return jieba.cut(line, cut_all=False, HMM=hmm)  # 精确模式
+    if mode == 'full':
+        return jieba.cut(line, cut_all=True, HMM=hmm)  # 全模式
+    if mode == 'search':
+        return jieba.cut_for_search(line, HMM=hmm)  # 搜索引擎模式
+    raise ValueError(f"未知的分词模式: {mode}，请选择 {' / '.join(SEG_MODES)}")
+
+def segment_lines(lines, mode='precise', hmm=None, convert=True):
+    """繁转简（convert 为 False 时跳过）后逐行分词，跳过空行，返回 (分词后的文本, 出错信息列表)。"""
+    output = []
+    errors = []
+    lines = [line.strip() for line in lines]
+    if convert:
+        lines = _opencc.convert_lines(lines)  # 繁体转简体，整批一次转换
+    for line in lines:
+        try:
+            if line:
+                output.append(" ".join(cut_line(line, mode, hmm)) + '\n')
+        except Exception as line_error:
+            errors.append(f"处理行失败：{line_error} (行内容：{line})")
+    return ''.join(output), errors
+
+def _segment_task(task):
+    """子进程任务：分片任务自行读取文件的字节范围，行块任务直接处理主进程读出的行。
+
+    出错时返回 (index, None, [出错信息])，只让所属文件失败，不影响其他文件。
+    """
+    index, payload, mode, hmm, convert, encoding = task
+    if isinstance(payload, str):
+        return index, None, [payload]  # 主进程读取该文件时已经出错
+    try:
+        if isinstance(payload, tuple):
+            file_path, start, end = payload
+            with read_shard_lines(file_path, start, end, encoding) as lines:
+                return (index, *segment_lines(lines, mode, hmm, convert))
+        return (index, *segment_lines(payload, mode, hmm, convert))
+    except Exception as e:
+        return index, None, [f"{type(e).__name__}: {e}"]
+
+def _file_tasks(file_pairs, mode, hmm, convert, encoding, shard_size, batch_size):
+    """把所有文件展开成按顺序排列的工作单元，大文件被切成多个分片，各进程负载均衡。
+
+    某个文件切分或读取出错时，用出错信息（字符串）代替后续的工作单元，继续展开下一个文件。
+    """
+    for index, (input_file, _) in enumerate(file_pairs):
+        try:
+            if not compression_of(input_file):
+                for start, end in split_file_shards(input_file, shard_size):
+                    yield index, (input_file, start, end), mode, hmm, convert, encoding
+                continue
+            with open_corpus(input_file, 'r', encoding=encoding) as f_in:
+                for lines in iter(lambda: list(islice(f_in, batch_size)), []):
+                    yield index, lines, mode, hmm, convert, encoding
+        except Exception as e:
+            yield index, f"{type(e).__name__}: {e}", mode, hmm, convert, encoding
+
+def create_pool(workers, custom_dict_dir, backend='jieba', lexicon_files=()):
+    """创建分词进程池；主进程先加载词典，fork 出来的子进程无需重复加载。"""
+    global _pool_workers
+    init_worker(custom_dict_dir, backend, lexicon_files)
+    _pool_workers = workers
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                               initargs=(custom_dict_dir, backend, tuple(lexicon_files)))
+
+def segment_files(executor, file_pairs, mode='precise', hmm=None, encoding='utf-8',
+                  shard_size=SHARD_SIZE, batch_size=BATCH_SIZE, convert=True, window=None):
+    """对 [(输入文件, 输出文件), ...] 分词，返回分词失败的输入文件列表。
+
+    所有文件的分片排成一个任务流交给进程池，文件之间不再互相等待；
+    结果按提交顺序取回，每个输出文件的行序与输入一致。
+    某个文件出错（如编码不对）时删除它不完整的输出，跳过它余下的分片，其他文件照常写出。
+    window 为同时在途的任务数，默认取 create_pool 进程数的两倍。
+    """
+    if mode not in SEG_MODES:
+        raise ValueError(f"未知的分词模式: {mode}，请选择 {' / '.join(SEG_MODES)}")
+    tasks = _file_tasks(file_pairs, mode, hmm, convert, encoding, shard_size, batch_size)
+    current, f_out = -1, None
+    failed = set()
+
+    def advance(index):
+        """关闭当前输出文件并依次打开后续文件，没有任务的空文件也会生成空输出。"""
+        nonlocal current, f_out
+        while current < index:
+            if f_out is not None:
+                f_out.close()
+                f_out = None
+                print(f"文件处理完成：{file_pairs[current][1]}")
+            current += 1
+            if current < len(file_pairs):
+                print(f"正在处理文件：{file_pairs[current][0]}")
+                f_out = open_corpus(file_pairs[current][1], 'w')
+
+    try:
+        for index, text, errors in map_ordered(executor, _segment_task, tasks, window or _pool_workers * 2):
+            if index in failed:
+                continue
+            advance(index)
+            if text is None:
+                f_out.close()
+                f_out = None
+                os.remove(file_pairs[index][1])
+                failed.add(index)
+                print(f"文件分词失败，已删除不完整的输出：{file_pairs[index][0]}（{errors[0]}）")
+                continue
+            f_out.write(text)
+            for error in errors:
+                print(error)
+        advance(len(file_pairs))
+    finally:
+        if f_out is not None:
+            f_out.close()
+    if failed:
+        print(f"共 {len(failed)} 个文件分词失败：" + "，".join(file_pairs[index][0] for index in sorted(failed)))
+    return [file_pairs[index][0] for index in sorted(failed)]
+
+def segment_file(executor, input_file, output_file, mode='precise', hmm=None, encoding='utf-8', convert=True):
+    """对单个文件分词，大文件同样按分片并行；失败时返回 False。"""
+    return not segment_files(executor, [(input_file, output_file)], mode, hmm, encoding, convert=convert)
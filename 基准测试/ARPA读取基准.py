@@ -0,0 +1,79 @@
+"""
+ARPA 读取基准：对比 extract_ngram_counts + extract_ngrams（两遍读取、逐行正则）、
+read_arpa（单遍、按制表符切分、按块换算概率）和按阶并行（每阶一个进程），以写出各阶频率文件的总耗时计
+用法：python 基准测试/ARPA读取基准.py [每阶 n-gram 数]
+"""
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 语言模型构建 import extract_ngram_counts, extract_ngrams, write_frequencies_to_file
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def write_sample_arpa(arpa_file, per_order, order=3, seed=0):
+    """用样本语料中的字拼出一个格式与 lmplz 输出相同的 ARPA 文件。"""
+    rng = random.Random(seed)
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        chars = sorted({ch for line in f for ch in line.strip() if '一' <= ch <= '鿿'})
+    with open(arpa_file, 'w', encoding='utf-8') as f:
+        f.write('\\data\\\n')
+        for n in range(1, order + 1):
+            f.write(f'ngram {n}={per_order}\n')
+        for n in range(1, order + 1):
+            f.write(f'\n\\{n}-grams:\n')
+            if n == 1:
+                f.write('-99\t<s>\t-0.30103\n')
+            for _ in range(per_order):
+                ngram = ' '.join(''.join(rng.choice(chars) for _ in range(rng.randint(1, 3))) for _ in range(n))
+                backoff = f'\t{-rng.random():.6f}' if n < order else ''
+                f.write(f'{-rng.random() * 7:.6f}\t{ngram}{backoff}\n')
+        f.write('\n\\end\\\n')
+
+def write_frequencies_reference(arpa_file, filename_template):
+    """原实现：先读头部，再逐行正则解析。"""
+    ngrams_counts = extract_ngram_counts(arpa_file)
+    current_order = 0
+    file = None
+    for order, ngram, prob in extract_ngrams(arpa_file):
+        if order != current_order:
+            if file:
+                file.close()
+            current_order = order
+            file = open(filename_template.format(order), 'w', encoding='utf-8')
+        file.write(f"{ngram}\t{round(prob * ngrams_counts.get(order, 1))}\n")
+    if file:
+        file.close()
+
+def main(per_order=300000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        arpa_file = os.path.join(tmp_dir, 'sample.arpa')
+        write_sample_arpa(arpa_file, per_order)
+        size_mb = os.path.getsize(arpa_file) / 1024 / 1024
+
+        results = {}
+        for name, func in (("extract_ngrams", lambda a, t: write_frequencies_reference(a, t)),
+                           ("read_arpa", lambda a, t: write_frequencies_to_file(None, a, t, workers=1)),
+                           ("per_order", lambda a, t: write_frequencies_to_file(None, a, t, workers=3))):
+            template = os.path.join(tmp_dir, f'{name}_{{}}.txt')
+            start = time.perf_counter()
+            func(arpa_file, template)
+            results[name] = (template, time.perf_counter() - start)
+
+        for name in ("read_arpa", "per_order"):
+            for n in range(1, 4):
+                if not filecmp.cmp(results["extract_ngrams"][0].format(n), results[name][0].format(n), shallow=False):
+                    raise AssertionError(f"{name} 的 {n}-gram 频率文件与原实现不一致")
+
+        print(f"样本：{size_mb:.1f} MB，每阶 {per_order} 个 n-gram")
+        for name, (_, elapsed) in results.items():
+            print(f"{name:<16} {elapsed:.3f} 秒  {size_mb / elapsed:.1f} MB/s")
+        for name in ("read_arpa", "per_order"):
+            print(f"{name} 加速比：{results['extract_ngrams'][1] / results[name][1]:.2f}x，输出一致")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300000)
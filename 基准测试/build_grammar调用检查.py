@@ -0,0 +1,133 @@
+"""
+build_grammar 调用检查：在临时目录中放一个假的 build_grammar（把标准输入原样写入 {语言}.gram，并记录起止时间），检查：
+合并文件、压缩的合并文件、流式合并（merge_to_gram）得到的 .gram 内容都与 merge_ngram_files 写出的合并文件一致；
+各档尺寸模型并行构建（同时运行的 build_grammar 不止一个），流式分档与先写合并文件的结果一致；
+某个构建以非零代码退出时报错并指出失败的语言，其余构建照常完成。
+不需要真实的 build_grammar。
+用法：python 基准测试/build_grammar调用检查.py
+"""
+import gzip
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import 语言模型构建 as builder
+from n元计数 import count_ngrams
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+# 假的 build_grammar：STUB_GRAM_FAIL 指定的语言读完输入后以代码 7 退出
+STUB_SOURCE = '''#!{python}
+import os, sys, time
+language = sys.argv[1]
+start = time.time()
+data = sys.stdin.buffer.read()
+time.sleep(0.5)
+with open(language + '.times', 'w') as f:
+    f.write('%f %f' % (start, time.time()))
+if language == os.environ.get('STUB_GRAM_FAIL'):
+    sys.exit(7)
+with open(language + '.gram', 'wb') as f:
+    f.write(data)
+'''
+
+def install_stub(work_dir):
+    stub = os.path.join(work_dir, 'build_grammar')
+    with open(stub, 'w', encoding='utf-8') as f:
+        f.write(STUB_SOURCE.format(python=sys.executable))
+    os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+
+def read_bytes(path):
+    with builder.open_corpus(path, 'rb') as f:
+        return f.read()
+
+def check_gram(name, language, expected_file):
+    assert read_bytes(builder.gram_file_name(language)) == read_bytes(expected_file), \
+        f"{name}：.gram 内容与合并文件不一致"
+    print(f"{name}：通过")
+
+def max_concurrency(languages):
+    """根据假 build_grammar 记录的起止时间，求同时运行的最大进程数。"""
+    events = []
+    for language in languages:
+        with open(language + '.times') as f:
+            start, end = map(float, f.read().split())
+        events += [(start, 1), (end, -1)]
+    running = peak = 0
+    for _, delta in sorted(events):
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+def main():
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            install_stub(tmp_dir)
+            segmented_file = '分词后.txt'
+            with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+                lines = [line for line in f if line.strip()]
+            with open(segmented_file, 'w', encoding='utf-8') as f:
+                f.writelines(builder.segment_lines(lines))
+            template = 'ngram_{}_.txt'
+            count_ngrams(segmented_file, template, 3)
+            file_list = [template.format(n) for n in range(1, 4)]
+
+            merged_file = 'merge1_2_3.txt'
+            builder.merge_ngram_files(file_list, merged_file)
+            builder.generate_gram_file(merged_file, 'zh-file')
+            check_gram('合并文件', 'zh-file', merged_file)
+
+            with open(merged_file, 'rb') as f_in, gzip.open(merged_file + '.gz', 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            builder.generate_gram_file(merged_file + '.gz', 'zh-gz')
+            check_gram('压缩的合并文件', 'zh-gz', merged_file)
+
+            builder.merge_to_gram(file_list, 'zh-stream', spill_entries=100)
+            check_gram('流式合并（含落盘 run）', 'zh-stream', merged_file)
+
+            # 样本很小，档位目标按合并文件大小的比例设置
+            merged_mb = os.path.getsize(merged_file) / 1024 / 1024
+            builder.SIZE_TIERS.clear()
+            builder.SIZE_TIERS.update({'m1': merged_mb * 0.7, 'm2': merged_mb * 0.85, 'm3': merged_mb * 2})
+            reports = builder.generate_size_tiers(file_list, 'merge_{}.txt', 'zh-tier', stream=False)
+            languages = [report['language'] for report in reports]
+            assert len(languages) == 6, f"应有 n2、n3 各三档：{languages}"
+            for language in languages:
+                check_gram(f'分档 {language}', language, f"merge_{language[len('zh-tier-'):]}.txt")
+            peak = max_concurrency(languages)
+            assert peak > 1, "各档的 build_grammar 没有同时运行"
+            print(f"分档并行：通过（最多 {peak} 个 build_grammar 同时运行）")
+
+            expected = {language: read_bytes(builder.gram_file_name(language)) for language in languages}
+            builder.generate_size_tiers(file_list, 'merge_{}.txt', 'zh-tier', stream=True)
+            for language in languages:
+                assert read_bytes(builder.gram_file_name(language)) == expected[language], \
+                    f"流式分档 {language} 与先写合并文件的结果不一致"
+            print("流式分档：通过")
+
+            failing = languages[1]
+            for language in languages:
+                os.remove(builder.gram_file_name(language))
+            os.environ['STUB_GRAM_FAIL'] = failing
+            try:
+                builder.generate_size_tiers(file_list, 'merge_{}.txt', 'zh-tier', stream=True)
+            except RuntimeError as e:
+                assert f"{failing}（退出代码 7）" in str(e), f"报错没有指出失败的语言：{e}"
+            else:
+                raise AssertionError("build_grammar 失败时应当报错")
+            finally:
+                del os.environ['STUB_GRAM_FAIL']
+            assert not os.path.exists(builder.gram_file_name(failing)), "失败的构建不应生成 .gram"
+            assert all(os.path.exists(builder.gram_file_name(language)) for language in languages if language != failing), \
+                "其余构建应照常完成"
+            print("构建失败：通过")
+        finally:
+            os.chdir(original_dir)
+
+if __name__ == '__main__':
+    main()
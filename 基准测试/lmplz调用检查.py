@@ -0,0 +1,149 @@
+"""
+lmplz 调用检查：在临时目录中放一个假的 lmplz（打印与 KenLM 相同格式的步骤标题和结束时的 Name:lmplz 资源统计，
+把收到的文本原样记下），检查 generate_arpa 的几种输入方式和报告解析：
+未压缩文件用 --text 读取；压缩文件、逐块分词、流式清洗分词的结果写入标准输入，内容必须与写出的分词文件一致；
+lmplz 以非零代码退出（包括不读完标准输入就退出）时报错并带上最后的输出，临时目录被删除。
+不需要安装 KenLM。
+用法：python 基准测试/lmplz调用检查.py
+"""
+import gzip
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import 语言模型构建 as builder
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+STEP_TITLES = ['Counting and sorting n-grams', 'Calculating and sorting adjusted counts',
+               'Calculating and sorting initial probabilities',
+               'Calculating and writing order-interpolated probabilities', 'Writing ARPA model']
+
+# 假的 lmplz：参数写入 args.json，收到的文本写入 received.txt；STUB_LMPLZ_EXIT 指定退出代码，
+# STUB_LMPLZ_EARLY 为真时不读标准输入直接退出
+STUB_SOURCE = '''#!{python}
+import json, os, sys, time
+args = sys.argv[1:]
+out_dir = os.environ['STUB_LMPLZ_DIR']
+with open(os.path.join(out_dir, 'args.json'), 'w') as f:
+    json.dump(args, f)
+code = int(os.environ.get('STUB_LMPLZ_EXIT', '0'))
+if os.environ.get('STUB_LMPLZ_EARLY'):
+    sys.stderr.write('stub: 提前退出\\n')
+    sys.exit(code)
+titles = {titles!r}
+for i, title in enumerate(titles, 1):
+    sys.stderr.write('=== %d/5 %s ===\\n' % (i, title))
+    sys.stderr.flush()
+    if i == 1:
+        if '--text' in args:
+            with open(args[args.index('--text') + 1], 'rb') as f:
+                data = f.read()
+        else:
+            data = sys.stdin.buffer.read()
+        with open(os.path.join(out_dir, 'received.txt'), 'wb') as f:
+            f.write(data)
+        sys.stderr.write('*' * 100 + '\\n')
+    time.sleep(0.05)
+if code:
+    sys.stderr.write('stub: 失败\\n')
+    sys.exit(code)
+with open(args[args.index('--arpa') + 1], 'w') as f:
+    f.write('\\\\data\\\\\\nngram 1=1\\n\\n\\\\1-grams:\\n-1.0\\t<s>\\n\\n\\\\end\\\\\\n')
+sys.stderr.write('Name:lmplz\\tVmPeak:100 kB\\tVmRSS:50 kB\\tRSSMax:2000 kB\\tuser:0.1\\tsys:0.0\\tCPU:0.1\\treal:0.3\\n')
+'''
+
+def install_stub(bin_dir):
+    os.makedirs(bin_dir)
+    stub = os.path.join(bin_dir, 'lmplz')
+    with open(stub, 'w', encoding='utf-8') as f:
+        f.write(STUB_SOURCE.format(python=sys.executable, titles=STEP_TITLES))
+    os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+
+def run_case(name, segmented, expected_file, stub_dir, tmp_root, text_input):
+    """运行一次 generate_arpa，检查收到的文本、--text 参数、步骤报告和临时目录。"""
+    arpa_file = os.path.join(stub_dir, 'log.arpa')
+    report = builder.generate_arpa(segmented, arpa_file, 3, (0, 1, 1, 1), tmp_root)
+    with open(os.path.join(stub_dir, 'args.json')) as f:
+        args = json.load(f)
+    with open(os.path.join(stub_dir, 'received.txt'), 'rb') as f:
+        received = f.read()
+    with builder.open_corpus(expected_file, 'rb') as f:
+        expected = f.read()
+
+    assert received == expected, f"{name}：lmplz 收到的文本与分词文件不一致"
+    assert ('--text' in args) == text_input, f"{name}：--text 参数不符合预期：{args}"
+    assert args[args.index('--prune') + 1:] == ['0', '1', '1'], f"{name}：剪枝阈值个数应截断为阶数：{args}"
+    memory = args[args.index('-S') + 1]
+    assert memory[:-1].isdigit() and memory[-1] in 'MG', f"{name}：-S 参数格式不对：{memory}"
+    assert [step['step'] for step in report['steps']] == [1, 2, 3, 4, 5], f"{name}：步骤解析不完整：{report}"
+    assert [step['title'] for step in report['steps']] == STEP_TITLES, f"{name}：步骤标题解析不对"
+    assert all(step['seconds'] >= 0 for step in report['steps']), f"{name}：步骤耗时缺失"
+    assert report['stats'].get('RSSMax') == '2000 kB', f"{name}：没有解析出 Name:lmplz 资源统计"
+    assert os.listdir(tmp_root) == [], f"{name}：lmplz 临时目录没有删除"
+    print(f"{name}：通过（{len(received)} 字节，{'--text' if text_input else '标准输入'}）")
+
+def expect_failure(name, segmented, stub_dir, tmp_root, env):
+    os.environ.update(env)
+    try:
+        builder.generate_arpa(segmented, os.path.join(stub_dir, 'log.arpa'), 3, (0,), tmp_root)
+    except RuntimeError as e:
+        message = str(e)
+    else:
+        raise AssertionError(f"{name}：lmplz 失败时应当报错")
+    finally:
+        for key in env:
+            del os.environ[key]
+    assert f"退出代码: {env['STUB_LMPLZ_EXIT']}" in message and 'stub:' in message, f"{name}：报错信息不完整：{message}"
+    assert os.listdir(tmp_root) == [], f"{name}：失败后 lmplz 临时目录没有删除"
+    print(f"{name}：通过")
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stub_dir = os.path.join(tmp_dir, 'stub')
+        tmp_root = os.path.join(tmp_dir, 'ARPAtmp')
+        install_stub(os.path.join(tmp_dir, 'bin'))
+        os.makedirs(stub_dir)
+        os.environ['PATH'] = os.path.join(tmp_dir, 'bin') + os.pathsep + os.environ['PATH']
+        os.environ['STUB_LMPLZ_DIR'] = stub_dir
+
+        raw_dir = os.path.join(tmp_dir, '语料输入')
+        os.makedirs(raw_dir)
+        for i in range(3):
+            shutil.copy(SAMPLE_FILE, os.path.join(raw_dir, f'样本{i}.txt'))
+        cleaned_file = os.path.join(tmp_dir, '清理后.txt')
+        segmented_file = os.path.join(tmp_dir, '分词后.txt')
+        builder.preprocess_corpus([raw_dir], cleaned_file)
+        builder.segment_corpus(cleaned_file, segmented_file)
+        compressed_file = segmented_file + '.gz'
+        with open(segmented_file, 'rb') as f_in, gzip.open(compressed_file, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+        run_case('未压缩文件', segmented_file, segmented_file, stub_dir, tmp_root, True)
+        run_case('压缩文件', compressed_file, segmented_file, stub_dir, tmp_root, False)
+        run_case('逐块分词', builder.iter_segment_corpus(cleaned_file, 50), segmented_file, stub_dir, tmp_root, False)
+        for workers in (1, 2):
+            fused_file = os.path.join(tmp_dir, f'流式分词后{workers}.txt')
+            builder.preprocess_and_segment([raw_dir], fused_file, workers=workers)
+            run_case(f'流式清洗分词（{workers} 进程）', builder.iter_preprocess_and_segment([raw_dir], workers=workers),
+                     fused_file, stub_dir, tmp_root, False)
+
+        expect_failure('非零退出', segmented_file, stub_dir, tmp_root, {'STUB_LMPLZ_EXIT': '3'})
+        # 输入远大于管道缓冲区，写标准输入时必然遇到管道断开
+        flood = ('中文 分词 ' * 100000 + '\n' for _ in range(50))
+        expect_failure('未读完标准输入就退出', flood, stub_dir, tmp_root,
+                       {'STUB_LMPLZ_EXIT': '2', 'STUB_LMPLZ_EARLY': '1'})
+        try:
+            builder.run_lmplz(['lmplz-不存在的命令'])
+        except RuntimeError as e:
+            assert '找不到' in str(e), f"找不到命令时的报错不对：{e}"
+        else:
+            raise AssertionError("找不到 lmplz 时应当报错")
+        print("找不到 lmplz：通过")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+n-gram 索引基准：对比把 ARPA 解析进字典后查询，与 mmap 打开二进制索引后查询
+随机查询（含未登录词、需要多次回退的上下文）的结果必须与字典实现一致（float32 精度内）。
+用法：python 基准测试/n元索引基准.py [每阶 n-gram 数] [查询次数]
+"""
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from n元索引 import build_index, iter_arpa_sections, NgramIndex
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def write_sample_arpa(arpa_file, per_order, order=3, seed=0):
+    """生成各阶 n-gram 都由 1-gram 中的词组成的 ARPA 文件。"""
+    rng = random.Random(seed)
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        chars = sorted({ch for line in f for ch in line.strip() if '一' <= ch <= '鿿'})
+    words = {''.join(rng.choice(chars) for _ in range(rng.randint(1, 3))) for _ in range(per_order)}
+    vocab = ['<unk>', '<s>', '</s>'] + sorted(words)
+    sections = [[(w,) for w in vocab]]
+    known = vocab[1:]
+    for n in range(2, order + 1):
+        sections.append(list({tuple(rng.choice(known) for _ in range(n)) for _ in range(per_order)}))
+    with open(arpa_file, 'w', encoding='utf-8') as f:
+        f.write('\\data\\\n')
+        for n, ngrams in enumerate(sections, 1):
+            f.write(f'ngram {n}={len(ngrams)}\n')
+        for n, ngrams in enumerate(sections, 1):
+            f.write(f'\n\\{n}-grams:\n')
+            for ngram in ngrams:
+                logprob = -99 if ngram == ('<s>',) else -rng.random() * 7
+                backoff = f'\t{-rng.random():.6f}' if n < order else ''
+                f.write(f'{logprob:.6f}\t{" ".join(ngram)}{backoff}\n')
+        f.write('\n\\end\\\n')
+    return vocab, sections
+
+def load_dicts(arpa_file):
+    """参照实现：整个模型读进字典。"""
+    model = {}
+    for _, entries in iter_arpa_sections(arpa_file):
+        for logprob, words, backoff in entries:
+            model[tuple(words)] = (logprob, backoff)
+    return model
+
+def dict_log_prob(model, order, word, context):
+    context = tuple(w if (w,) in model else '<unk>' for w in context[max(0, len(context) - order + 1):])
+    word = word if (word,) in model else '<unk>'
+    backoff = 0.0
+    for start in range(len(context) + 1):
+        entry = model.get(context[start:] + (word,))
+        if entry is not None:
+            return backoff + entry[0]
+        entry = model.get(context[start:])
+        if entry is not None:
+            backoff += entry[1]
+
+def main(per_order=200000, queries=100000, order=3):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        arpa_file = os.path.join(tmp_dir, 'sample.arpa')
+        index_file = os.path.join(tmp_dir, 'sample.arpa.idx')
+        vocab, sections = write_sample_arpa(arpa_file, per_order, order)
+
+        start = time.perf_counter()
+        build_index(arpa_file, index_file)
+        build_seconds = time.perf_counter() - start
+
+        tasks = []
+        for _ in range(queries):
+            ngram = list(rng.choice(sections[order - 1]))
+            for i in range(len(ngram)):
+                roll = rng.random()
+                if roll < 0.3:
+                    ngram[i] = rng.choice(vocab)  # 打乱，需要回退
+                elif roll < 0.35:
+                    ngram[i] = '未登录词'
+            tasks.append((ngram[-1], ngram[:-1]))
+
+        start = time.perf_counter()
+        model = load_dicts(arpa_file)
+        dict_load = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = [dict_log_prob(model, order, word, context) for word, context in tasks]
+        dict_query = time.perf_counter() - start
+        del model
+
+        start = time.perf_counter()
+        index = NgramIndex(index_file)
+        index_load = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = [index.log_prob(word, context) for word, context in tasks]
+        index_query = time.perf_counter() - start
+        index.close()
+
+        for (word, context), a, b in zip(tasks, expected, actual):
+            if not math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-5):
+                raise AssertionError(f"查询结果不一致：p({word} | {context}) 字典 {a} 索引 {b}")
+
+        print(f"样本：ARPA {os.path.getsize(arpa_file) / 1024 / 1024:.1f} MB，"
+              f"索引 {os.path.getsize(index_file) / 1024 / 1024:.1f} MB，编译 {build_seconds:.2f} 秒")
+        print(f"字典  加载 {dict_load:.3f} 秒  查询 {queries / dict_query:,.0f} 次/秒")
+        print(f"索引  打开 {index_load:.4f} 秒  查询 {queries / index_query:,.0f} 次/秒")
+        print(f"{queries} 次查询结果一致")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
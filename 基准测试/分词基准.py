@@ -0,0 +1,149 @@
+"""
+分词吞吐基准：在固定样本上对比各条分词路径，输出 JSON（行/秒、字符/秒、峰值内存）
+
+路径：
+  segment_corpus  语言模型构建.segment_corpus（单进程，jieba 精确模式 + HMM，或 native 后端）
+  engine          分词引擎.segment_files（内建多线程分词.py / 系统多线程分词.py 使用的进程池）
+变量：分词模式、HMM、OpenCC 繁转简、进程数、后端（jieba / native）。
+native 后端使用 jieba 自带的 dict.txt 作为词表，两个后端的词表相同，只比较实现。
+每个组合在独立的子进程中运行，峰值内存互不影响；词典加载时间单独记录，不计入吞吐。
+
+用法：python 基准测试/分词基准.py [--repeat 200] [--workers 1,4] [--modes precise,full,search]
+                                 [--backends jieba,native] [--output 结果.json]
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def jieba_dict_file():
+    import jieba
+    return os.path.join(os.path.dirname(jieba.__file__), 'dict.txt')
+
+def peak_rss_mb():
+    """返回 (本进程, 子进程) 的峰值常驻内存（MB）。"""
+    if resource is None:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS 单位为字节，Linux 为 KB
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1))
+
+# ========== 单个组合（子进程内执行） ==========
+def run_segment_corpus(config, input_file, output_file):
+    import 语言模型构建 as builder
+    builder.SEGMENT_BACKEND = config['backend']
+    builder.SEGMENT_LEXICON_FILES = [jieba_dict_file()]
+    start = time.perf_counter()
+    builder.prepare_segmenter()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    builder.segment_corpus(input_file, output_file)
+    return load_seconds, time.perf_counter() - start
+
+def run_engine(config, input_file, output_file):
+    import 分词引擎 as engine
+    start = time.perf_counter()
+    executor = engine.create_pool(config['workers'], '', config['backend'], [jieba_dict_file()])
+    with executor:
+        executor.submit(int).result()  # 等子进程启动完成
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # 样本文件较小，按进程数切成更细的分片，否则只有一个分片、多进程测不出差别
+        shard_size = max(64 * 1024, os.path.getsize(input_file) // (config['workers'] * 8))
+        engine.segment_files(executor, [(input_file, output_file)], config['mode'], config['hmm'],
+                             shard_size=shard_size, convert=config['opencc'])
+        return load_seconds, time.perf_counter() - start
+
+def run_one(config, input_file):
+    """执行一个组合并返回结果字典。"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, 'output.txt')
+        runner = run_segment_corpus if config['path'] == 'segment_corpus' else run_engine
+        load_seconds, elapsed = runner(config, input_file, output_file)
+        with open(output_file, 'rb') as f:
+            output_lines = sum(1 for _ in f)
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = chars = 0
+        for line in f:
+            lines += 1
+            chars += len(line)
+    rss, children_rss = peak_rss_mb()
+    return {**config,
+            'lines': lines, 'chars': chars, 'output_lines': output_lines,
+            'load_seconds': round(load_seconds, 3), 'seconds': round(elapsed, 3),
+            'lines_per_sec': round(lines / elapsed), 'chars_per_sec': round(chars / elapsed),
+            'peak_rss_mb': rss, 'children_peak_rss_mb': children_rss, 'cpu_count': os.cpu_count()}
+
+# ========== 组合矩阵 ==========
+def build_configs(modes, workers_list, backends):
+    configs = [{'path': 'segment_corpus', 'backend': backend, 'mode': 'precise',
+                'hmm': backend == 'jieba', 'opencc': False, 'workers': 1}
+               for backend in backends]
+    for backend, mode, hmm, opencc, workers in itertools.product(
+            backends, modes, (False, True), (False, True), workers_list):
+        if backend == 'native' and hmm:
+            continue  # native 后端没有 HMM
+        configs.append({'path': 'engine', 'backend': backend, 'mode': mode,
+                        'hmm': hmm, 'opencc': opencc, 'workers': workers})
+    return configs
+
+def main():
+    parser = argparse.ArgumentParser(description="分词吞吐基准")
+    parser.add_argument('--repeat', type=int, default=200, help="样本重复次数")
+    parser.add_argument('--workers', default=f"1,{os.cpu_count() or 1}", help="进程数列表，逗号分隔")
+    parser.add_argument('--modes', default='precise,full,search', help="分词模式列表，逗号分隔")
+    parser.add_argument('--backends', default='jieba,native', help="分词后端列表，逗号分隔")
+    parser.add_argument('--output', help="把 JSON 结果另存到文件")
+    parser.add_argument('--run', help=argparse.SUPPRESS)  # 内部使用：在子进程中执行单个组合
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_one(json.loads(args.run), args.input), ensure_ascii=False))
+        return
+
+    workers_list = sorted({int(w) for w in args.workers.split(',')})
+    configs = build_configs(args.modes.split(','), workers_list, args.backends.split(','))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = os.path.join(tmp_dir, 'input.txt')
+        with open(SAMPLE_FILE, 'rb') as f:
+            sample = f.read()
+        with open(input_file, 'wb') as f:
+            f.write(sample * args.repeat)
+
+        for i, config in enumerate(configs, 1):
+            print(f"[{i}/{len(configs)}] {json.dumps(config, ensure_ascii=False)}", file=sys.stderr)
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                   '--run', json.dumps(config), '--input', input_file],
+                                  capture_output=True, text=True, cwd=tmp_dir)
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                raise RuntimeError(f"组合运行失败：{config}")
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    report = json.dumps(results, ensure_ascii=False, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+分词词表内存基准：生成一个与 merge1_2_3.txt 格式相同（词\t频次）的大词表，
+测量 DagSegmenter 编译字典树和从缓存加载的耗时与内存。每一步在独立的子进程中运行，内存互不影响。
+加载后的常驻内存就是每个分词进程（fork 前由主进程加载）需要的内存。
+用法：python 基准测试/分词词表内存基准.py [词条数]
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def write_lexicon(lexicon_file, entries, seed=0):
+    """用常用字拼出 entries 个不同的词（1~8 字，两三字的词最多），频次按长尾分布。"""
+    rng = random.Random(seed)
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        sample_chars = sorted({ch for line in f for ch in line if '一' <= ch <= '鿿'})
+    # 样本中的字太少，补上 CJK 基本区的前 3500 个字，使首字分布接近真实词表
+    chars = sample_chars + [chr(code) for code in range(0x4E00, 0x4E00 + 3500)]
+    lengths = [1, 2, 2, 2, 3, 3, 4, 4, 5, 6, 7, 8]
+    words = set()
+    while len(words) < entries:
+        words.add(''.join(rng.choice(chars) for _ in range(rng.choice(lengths))))
+    with open(lexicon_file, 'w', encoding='utf-8') as f:
+        for word in sorted(words):
+            f.write(f"{word}\t{int(rng.paretovariate(1.2))}\n")
+
+def current_rss_mb():
+    """当前常驻内存（MB），只在 Linux 上可用。"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        return None
+
+def peak_rss_mb():
+    """本进程的峰值常驻内存（MB）。
+
+    Linux 上读 VmHWM：ru_maxrss 在 exec 后保留 fork 时父进程的峰值（这里父进程刚生成完词表），不能用来测子进程。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS 单位为字节，Linux 为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def run_step(step, lexicon_file, cache_dir):
+    """子进程内执行：compile 为冷启动编译并写缓存，load 为从缓存加载。"""
+    from 词典分词 import DagSegmenter
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    segmenter = DagSegmenter.load([lexicon_file], cache_dir)
+    seconds = time.perf_counter() - start
+    rss = current_rss_mb()
+    nodes = len(segmenter.logp)
+    arrays = (segmenter.first.itemsize * len(segmenter.first) + segmenter.chars.itemsize * len(segmenter.chars)
+              + segmenter.logp.itemsize * nodes)
+    return {'step': step, 'seconds': round(seconds, 2), 'nodes': nodes,
+            'arrays_mb': round(arrays / 1024 / 1024, 1),
+            'rss_delta_mb': None if rss is None else round(rss - baseline, 1),
+            'peak_rss_mb': None if peak_rss_mb() is None else round(peak_rss_mb(), 1)}
+
+def main(entries=3000000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lexicon_file = os.path.join(tmp_dir, 'merge1_2_3.txt')
+        cache_dir = os.path.join(tmp_dir, '词典缓存')
+        write_lexicon(lexicon_file, entries)
+        print(f"词表：{entries} 个词，{os.path.getsize(lexicon_file) / 1024 / 1024:.1f} MB")
+
+        for step in ('compile', 'load'):
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', step, lexicon_file, cache_dir],
+                                  capture_output=True, text=True, cwd=tmp_dir)
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                raise RuntimeError(f"{step} 运行失败")
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{step:<8} {result['seconds']:>7} 秒  节点 {result['nodes']}  数组 {result['arrays_mb']} MB  "
+                  f"加载后增加 {result['rss_delta_mb']} MB  峰值 {result['peak_rss_mb']} MB")
+        cache_mb = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)) / 1024 / 1024
+        print(f"缓存文件 {cache_mb:.1f} MB")
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        print(json.dumps(run_step(*sys.argv[2:5])))
+    else:
+        main(*(int(arg) for arg in sys.argv[1:2]))
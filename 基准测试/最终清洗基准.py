@@ -0,0 +1,42 @@
+"""
+TXT最终清洗 的吞吐基准：对比逐行清洗 clean_file 与整块快速清洗 clean_file_fast（MB/s）
+用法：python 基准测试/最终清洗基准.py [重复次数]
+"""
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from TXT最终清洗 import clean_file, clean_file_fast
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def main(repeat=5000):
+    with open(SAMPLE_FILE, 'rb') as f:
+        sample = f.read()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = os.path.join(tmp_dir, 'input.txt')
+        with open(input_file, 'wb') as f:
+            f.write(sample * repeat)
+        size_mb = os.path.getsize(input_file) / 1024 / 1024
+
+        results = {}
+        for name, func in (("clean_file", clean_file), ("clean_file_fast", clean_file_fast)):
+            output_file = os.path.join(tmp_dir, f'{name}.txt')
+            start = time.perf_counter()
+            func(input_file, output_file)
+            results[name] = (output_file, time.perf_counter() - start)
+
+        if not filecmp.cmp(results["clean_file"][0], results["clean_file_fast"][0], shallow=False):
+            raise AssertionError("快速清洗的输出与逐行清洗不一致")
+
+        print(f"样本：{size_mb:.1f} MB")
+        for name, (_, elapsed) in results.items():
+            print(f"{name:<16} {elapsed:.3f} 秒  {size_mb / elapsed:.1f} MB/s")
+        print(f"加速比：{results['clean_file'][1] / results['clean_file_fast'][1]:.2f}x，输出一致")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
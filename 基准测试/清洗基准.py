@@ -0,0 +1,36 @@
+"""
+预处理单行清洗的微基准：对比 clean_line_chain（逐条 re.sub）与 clean_line（单遍引擎）
+用法：python 基准测试/清洗基准.py [重复次数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 语言模型构建 import clean_line, clean_line_chain
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def bench(func, lines, max_length=30):
+    """返回 (输出, 耗时秒)。"""
+    start = time.perf_counter()
+    output = [func(line, max_length) for line in lines]
+    return output, time.perf_counter() - start
+
+def main(repeat=2000):
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        lines = f.readlines() * repeat
+    chars = sum(len(line) for line in lines)
+
+    chain_output, chain_time = bench(clean_line_chain, lines)
+    engine_output, engine_time = bench(clean_line, lines)
+    if chain_output != engine_output:
+        raise AssertionError("单遍引擎的输出与原实现不一致")
+
+    print(f"样本：{len(lines)} 行，{chars} 字符")
+    for name, elapsed in (("clean_line_chain", chain_time), ("clean_line", engine_time)):
+        print(f"{name:<18} {elapsed:.3f} 秒  {len(lines) / elapsed:,.0f} 行/秒  {chars / elapsed / 1e6:.2f} M字符/秒")
+    print(f"加速比：{chain_time / engine_time:.2f}x，输出一致")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
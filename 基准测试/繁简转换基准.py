@@ -0,0 +1,54 @@
+"""
+批量繁简转换的等价性检查与基准：BatchConverter.convert_lines 对比逐行 OpenCC.convert
+等价性样本包括固定样本语料，以及由词典中的单字、多字词条和分隔符随机拼出的行。
+用法：python 基准测试/繁简转换基准.py [重复次数] [随机行数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 繁简转换 import BatchConverter
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+def random_lines(converter, count, seed=0):
+    """从词典条目和常见字符中随机拼出的行，覆盖多字词条、词条重叠和分隔符。"""
+    rng = random.Random(seed)
+    keys = sorted({key for stage in converter.opencc._dict_chain_data for _, _, mapping in stage for key in mapping})
+    phrases = [key for key in keys if len(key) > 1]
+    pieces = keys + phrases * 5 + list("的一是在不了有和人这中大为上个，。！？、 -.abc123《》“”")
+    return [''.join(rng.choice(pieces) for _ in range(rng.randint(1, 20))) for _ in range(count)]
+
+def main(repeat=500, random_count=20000):
+    converter = BatchConverter('t2s')
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        sample = [line.strip() for line in f]
+    lines = random_lines(converter, random_count) + sample
+
+    expected = [converter.opencc.convert(line) for line in lines]
+    if converter.convert_lines(lines) != expected:
+        raise AssertionError("批量转换与逐行 OpenCC 不一致")
+    if [converter.convert(line) for line in lines] != expected:
+        raise AssertionError("单行转换与逐行 OpenCC 不一致")
+    print(f"等价性：{len(lines)} 行（其中随机行 {random_count}）与逐行 OpenCC 一致")
+
+    lines = sample * repeat
+    chars = sum(len(line) for line in lines)
+    start = time.perf_counter()
+    for line in lines:
+        converter.opencc.convert(line)
+    plain = time.perf_counter() - start
+    start = time.perf_counter()
+    converter.convert_lines(lines)
+    batch = time.perf_counter() - start
+    fast = sum(converter.convert_fast(line) is not None for line in sample) / len(sample)
+
+    print(f"样本：{len(lines)} 行，{chars} 字符，{fast:.0%} 的行走逐字查表")
+    for name, elapsed in (("OpenCC.convert", plain), ("convert_lines", batch)):
+        print(f"{name:<16} {elapsed:.3f} 秒  {len(lines) / elapsed:,.0f} 行/秒")
+    print(f"加速比：{plain / batch:.2f}x")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
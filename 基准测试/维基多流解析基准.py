@@ -0,0 +1,109 @@
+"""
+维基多流解析基准：在临时目录中生成一个小型多流 dump 及其索引，
+分别用 wiki_process（单流顺序解析）和 wiki_process_parallel（按索引并行解压）处理，输出必须逐字节一致。
+样本包含普通文章、繁体内容、表格、重定向和命名空间页面，最后一个数据流之后跟着单独的 </mediawiki> 结尾流。
+用法：python 基准测试/维基多流解析基准.py [文章数] [每个数据流的文章数] [进程数]
+"""
+import bz2
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 维基中文语料解析 import wiki_process, wiki_process_parallel
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '样本语料.txt')
+
+HEADER = '''<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="zh">
+  <siteinfo>
+    <sitename>维基百科</sitename>
+    <dbname>zhwiki</dbname>
+    <namespaces>
+      <namespace key="0" case="first-letter" />
+      <namespace key="4" case="first-letter">Wikipedia</namespace>
+    </namespaces>
+  </siteinfo>
+'''
+
+PAGE = '''  <page>
+    <title>{title}</title>
+    <ns>{ns}</ns>
+    <id>{page_id}</id>
+    <revision>
+      <id>{revision_id}</id>
+      <text bytes="{size}" xml:space="preserve">{text}</text>
+    </revision>
+  </page>
+'''
+
+def make_page(rng, lines, page_id):
+    """随机生成一个页面，返回 (标题, 页面 XML)。"""
+    kind = rng.random()
+    title = f'條目{page_id}'
+    ns = 0
+    body = '\n'.join(rng.sample(lines, 3))
+    if kind < 0.1:
+        text = f'#REDIRECT [[條目{page_id + 1}]]'
+    elif kind < 0.2:
+        title, ns, text = f'Wikipedia:頁面{page_id}', 4, body
+    else:
+        text = (f"'''{title}'''是一個測試條目。\n== 概述 ==\n{body}\n"
+                f"{{| class=\"wikitable\"\n|-\n| 表格 || 內容\n|}}\n"
+                f"* [[連結{page_id}|鏈接文字]]\n{{{{模板|參數}}}}\n== 參見 ==\n{rng.choice(lines)}\n")
+    page = PAGE.format(title=escape(title), ns=ns, page_id=page_id, revision_id=page_id * 10,
+                       size=len(text.encode('utf-8')), text=escape(text))
+    return title, page
+
+def write_multistream(dump_file, index_file, pages, per_stream, seed=0):
+    """按真实 dump 的结构写出：文件头一个流，每 per_stream 篇文章一个流，结尾单独一个流。"""
+    rng = random.Random(seed)
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    with open(dump_file, 'wb') as dump, open(index_file, 'w', encoding='utf-8') as index:
+        dump.write(bz2.compress(HEADER.encode('utf-8')))
+        for first in range(1, pages + 1, per_stream):
+            offset = dump.tell()
+            chunk = []
+            for page_id in range(first, min(first + per_stream, pages + 1)):
+                title, page = make_page(rng, lines, page_id)
+                index.write(f'{offset}:{page_id}:{title}\n')
+                chunk.append(page)
+            dump.write(bz2.compress(''.join(chunk).encode('utf-8')))
+        dump.write(bz2.compress(b'</mediawiki>\n'))
+
+def main(pages=2000, per_stream=100, workers=2):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_file = os.path.join(tmp_dir, 'zhwiki-multistream.xml.bz2')
+        index_file = os.path.join(tmp_dir, 'zhwiki-multistream-index.txt')
+        write_multistream(dump_file, index_file, pages, per_stream)
+        # 索引同时支持 .txt 和 .txt.bz2
+        with open(index_file, 'rb') as f_in, bz2.open(index_file + '.bz2', 'wb') as f_out:
+            f_out.write(f_in.read())
+
+        serial_file = os.path.join(tmp_dir, 'serial.txt')
+        start = time.perf_counter()
+        wiki_process(dump_file, serial_file)
+        serial_seconds = time.perf_counter() - start
+
+        for index in (index_file, index_file + '.bz2'):
+            parallel_file = os.path.join(tmp_dir, 'parallel.txt')
+            start = time.perf_counter()
+            wiki_process_parallel(dump_file, index, parallel_file, workers=workers)
+            parallel_seconds = time.perf_counter() - start
+            if not filecmp.cmp(serial_file, parallel_file, shallow=False):
+                raise AssertionError(f"并行解析结果与单流解析不一致（索引：{os.path.basename(index)}）")
+
+        with open(serial_file, 'r', encoding='utf-8') as f:
+            articles = sum(1 for line in f if line.startswith('【'))
+        print(f"样本：{pages} 个页面，每流 {per_stream} 个，dump {os.path.getsize(dump_file) / 1024:.0f} KB，"
+              f"保留文章 {articles} 篇")
+        print(f"单流顺序解析  {serial_seconds:.2f} 秒")
+        print(f"多流并行解析  {parallel_seconds:.2f} 秒（{workers} 进程）")
+        print("两种解析的输出一致")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
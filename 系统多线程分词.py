@@ -1,52 +1,22 @@
 import os
-import jieba
-from opencc import OpenCC
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from 语料工具 import strip_compression
+from 分词引擎 import create_pool, segment_files
+from 词典分词 import default_lexicon_files
 
 # ======= 配置参数 =======
-MAX_WORKERS = 20  # 并行线程数
+MAX_WORKERS = os.cpu_count() or 1  # 分词进程数
 cleaned_folder = 'autodl-tmp/语料清洗后'
 segmented_folder = 'autodl-tmp/语料分词后'
 CUSTOM_DICT_DIR = "autodl-tmp/自定义分词词典"
 FILE_ENCODING = "utf-8"  # 默认文件编码
+OUTPUT_CODEC = ''  # 输出压缩格式：'' 不压缩 / '.gz' / '.bz2' / '.xz' / '.zst'；输入按扩展名自动识别
+SEG_MODE = 'precise'  # 分词模式（'precise', 'full', 'search'）
+SEG_BACKEND = 'jieba'  # 分词后端：'jieba' / 'native'（基于项目词表的 DAG 分词，不使用 HMM）
+LEXICON_FILES = default_lexicon_files()  # native 后端的词表（分词词库.txt + zh_dicts），与 语言模型构建 相同，自定义词典会一并加入
+HMM = False  # 是否用 HMM 识别新词
 
-# 启用 jieba内部 多线程分词，这个不要用，自定义词典也得重复加载加载才行
-#jieba.enable_parallel(MAX_WORKERS)
-
-# 初始化 OpenCC 转换器
-opencc = OpenCC('t2s')
-
-# 加载自定义词典
-def load_custom_dict():
-    if os.path.isdir(CUSTOM_DICT_DIR):
-        for filename in os.listdir(CUSTOM_DICT_DIR):
-            dict_path = os.path.join(CUSTOM_DICT_DIR, filename)
-            if os.path.isfile(dict_path):
-                jieba.load_userdict(dict_path)
-                print(f"已加载自定义词典：{dict_path}")
-    elif os.path.isfile(CUSTOM_DICT_DIR):
-        jieba.load_userdict(CUSTOM_DICT_DIR)
-        print(f"已加载单个自定义词典：{CUSTOM_DICT_DIR}")
-    else:
-        print(f"路径 '{CUSTOM_DICT_DIR}' 无效，请检查。")
-
-# 逐行分词
-def process_file_stream(input_file, output_file):
-    try:
-        print(f"正在处理文件：{input_file}")
-        with open(input_file, 'r', encoding=FILE_ENCODING) as f_in, open(output_file, 'w', encoding='utf-8') as f_out:
-            for line in f_in:
-                try:
-                    line = opencc.convert(line.strip())  # 繁体转简体
-                    if line:
-                        seg_list = jieba.cut(line, cut_all=False, HMM=False)
-                        segmented_line = " ".join(seg_list)
-                        f_out.write(segmented_line + '\n')
-                except Exception as line_error:
-                    print(f"处理行失败：{line_error} (行内容：{line})")
-        print(f"文件处理完成：{output_file}")
-    except Exception as e:
-        print(f"文件 {input_file} 处理出错：{e}")
+# 线程池受 GIL 限制，jieba.enable_parallel 又拿不到自定义词典，这里统一使用 分词引擎 的进程池；
+# 文件按行对齐切成分片，少数几个超大文件也能让所有进程保持忙碌
 
 # 并行处理文件夹
 def process_folder_parallel(input_folder, output_folder):
@@ -56,28 +26,20 @@ def process_folder_parallel(input_folder, output_folder):
 
     os.makedirs(output_folder, exist_ok=True)
 
-    files = [(os.path.join(input_folder, filename), os.path.join(output_folder, filename + '_segmented.txt'))
+    files = [(os.path.join(input_folder, filename), os.path.join(output_folder, strip_compression(filename) + '_segmented.txt' + OUTPUT_CODEC))
              for filename in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, filename))]
 
     if not files:
         print(f"输入文件夹 '{input_folder}' 中没有可处理的文件。")
         return
 
-    # 使用线程池并行处理多个文件
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(process_file_stream, input_path, output_path): (input_path, output_path)
-                   for input_path, output_path in files}
-
-        for future in as_completed(futures):
-            input_path, output_path = futures[future]
-            try:
-                future.result()
-            except Exception as e:
-                print(f"文件 {input_path} 处理出错：{e}")
+    # 所有文件的分片排成一个任务流分发到进程池，输出按原顺序写回各自的文件
+    with create_pool(MAX_WORKERS, CUSTOM_DICT_DIR, SEG_BACKEND, LEXICON_FILES) as executor:
+        try:
+            segment_files(executor, files, SEG_MODE, HMM, encoding=FILE_ENCODING)
+        except Exception as e:
+            print(f"分词处理出错：{e}")
 
 if __name__ == '__main__':
-    # 加载自定义词典
-    load_custom_dict()
-
     # 并行处理文件夹中的所有文件
     process_folder_parallel(cleaned_folder, segmented_folder)
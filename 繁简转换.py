@@ -0,0 +1,80 @@
+"""
+批量繁简转换：在 OpenCC 外面加一层，减少逐行调用的开销
+
+OpenCC（opencc-python-reimplemented）每次 convert 都要重新切分字符串、建解析树，
+对预处理后不超过 30 字的短行，调用开销远大于实际转换。这里的做法：
+  1. 预先把词典中的单字映射编译成 str.translate 表；
+  2. 一行里没有出现任何多字词条（如 "乾隆"）时，OpenCC 的结果必然与逐字替换相同，直接 translate；
+  3. 其余的行用换行符拼接后一次性交给 OpenCC，再按换行符拆回（换行符是 OpenCC 的分隔符，词条不会跨行）。
+使用官方 C++ 版 opencc 时拿不到词典，只做第 3 步的批量拼接。
+"""
+import re
+from opencc import OpenCC
+
+class BatchConverter:
+    """与 OpenCC(conversion).convert 结果逐字一致的批量转换器。"""
+
+    def __init__(self, conversion='t2s'):
+        self.opencc = OpenCC(conversion)
+        self.stages = self._compile_stages()
+
+    def _compile_stages(self):
+        """把转换链的每一级编译成 (单字转换表, 多字词条集合, 词条首字正则, 最长词条长度)。"""
+        chain = getattr(self.opencc, '_dict_chain_data', None)
+        if not chain:
+            return None
+        separators = getattr(self.opencc, 'split_chars_re', None)
+        stages = []
+        for stage in chain:
+            chars = {key for _, _, mapping in stage for key in mapping if len(key) == 1}
+            phrases = {key for _, _, mapping in stage for key in mapping if len(key) > 1}
+            table = {}
+            for ch in chars:
+                if separators is not None and separators.fullmatch(ch):
+                    continue  # OpenCC 不转换分隔符
+                converted = self.opencc._convert(ch, [stage])  # 单字的结果直接取自 OpenCC 本身
+                if converted != ch:
+                    table[ord(ch)] = converted
+            first_chars = ''.join(sorted({phrase[0] for phrase in phrases}))
+            pattern = re.compile(f"[{re.escape(first_chars)}]") if first_chars else None
+            max_len = max(map(len, phrases), default=1)
+            stages.append((table, phrases, pattern, max_len))
+        return stages
+
+    @staticmethod
+    def _has_phrase(text, phrases, pattern, max_len):
+        """text 中是否出现多字词条。"""
+        if pattern is None:
+            return False
+        for match in pattern.finditer(text):
+            i = match.start()
+            for length in range(2, max_len + 1):
+                if text[i:i + length] in phrases:
+                    return True
+        return False
+
+    def convert_fast(self, text):
+        """逐字查表转换；出现多字词条、必须由 OpenCC 处理时返回 None。"""
+        if self.stages is None:
+            return None
+        for table, phrases, pattern, max_len in self.stages:
+            if self._has_phrase(text, phrases, pattern, max_len):
+                return None
+            text = text.translate(table)
+        return text
+
+    def convert(self, text):
+        result = self.convert_fast(text)
+        return self.opencc.convert(text) if result is None else result
+
+    def convert_lines(self, lines):
+        """批量转换不含换行符的若干行，返回转换后的列表。"""
+        results = [self.convert_fast(line) for line in lines]
+        slow = [i for i, result in enumerate(results) if result is None]
+        if slow:
+            converted = self.opencc.convert('\n'.join(lines[i] for i in slow)).split('\n')
+            if len(converted) != len(slow):  # 行内含有换行符时无法按行拆回，逐行转换
+                converted = [self.opencc.convert(lines[i]) for i in slow]
+            for i, result in zip(slow, converted):
+                results[i] = result
+        return results
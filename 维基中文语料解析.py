@@ -3,13 +3,21 @@
 下载链接
 https://dumps.wikimedia.org/zhwiki/latest/zhwiki-latest-pages-articles.xml.bz2  
 需要安装的库：pip install opencc-python-reimplemented tqdm bz2file gensim
+多流版本（并行解压，需同时下载索引文件）
+https://dumps.wikimedia.org/zhwiki/latest/zhwiki-latest-pages-articles-multistream.xml.bz2
+https://dumps.wikimedia.org/zhwiki/latest/zhwiki-latest-pages-articles-multistream-index.txt.bz2
 """
 from gensim.corpora.wikicorpus import extract_pages, filter_wiki
+import bz2
 import bz2file
+import io
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from opencc import OpenCC
 from tqdm import tqdm
 import codecs
+from 语料工具 import map_ordered
 
 def wiki_replace(d, openCC):
     """
@@ -39,6 +47,10 @@ def wiki_replace(d, openCC):
     
     return s
 
+def is_article(d):
+    """排除标题和特殊内容（命名空间页面、重定向等）"""
+    return not re.findall('^[a-zA-Z]+:', d[0]) and d[0] and not re.findall(u'^#', d[1])
+
 def wiki_process(input_file, save_path):
     """
     处理wiki文件并保存
@@ -58,7 +70,7 @@ def wiki_process(input_file, save_path):
         
         for d in w:
             # 排除标题和特殊内容
-            if not re.findall('^[a-zA-Z]+:', d[0]) and d[0] and not re.findall(u'^#', d[1]):
+            if is_article(d):
                 # 替换内容并写入文件
                 s = wiki_replace(d, openCC)
                 f.write(s + '\n\n\n')
@@ -68,6 +80,73 @@ def wiki_process(input_file, save_path):
                 if i % 100 == 0:
                     w.set_description(u'已获取%s篇文章' % i)
 
+# ========== 多流并行解析 ==========
+def read_multistream_offsets(index_file):
+    """
+    读取多流索引，返回所有 bz2 数据块的起始偏移（升序去重）
+    索引每行格式为 偏移:页面ID:标题，同一数据块内的约100篇文章共享一个偏移
+    """
+    opener = bz2.open if index_file.endswith('.bz2') else open
+    offsets = set()
+    with opener(index_file, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                offsets.add(int(line.split(':', 1)[0]))
+    return sorted(offsets)
+
+def read_stream(input_file, start, end):
+    """解压 [start, end) 范围内的一个独立 bz2 数据块"""
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        return bz2.decompress(f.read(end - start))
+
+_worker_opencc = None
+
+def _init_worker():
+    """每个子进程创建一次自己的 OpenCC 实例"""
+    global _worker_opencc
+    _worker_opencc = OpenCC('t2s')
+
+def _process_stream(task):
+    """
+    子进程任务：解压一个数据块并清理其中的文章
+    数据块只有若干 <page> 片段，补上文件头（<mediawiki> 与 <siteinfo>）后交给 extract_pages 解析
+    """
+    input_file, header, start, end = task
+    body = read_stream(input_file, start, end).rstrip()
+    if body.endswith(b'</mediawiki>'):
+        body = body[:-len(b'</mediawiki>')]
+    pages = extract_pages(io.BytesIO(header + body + b'</mediawiki>'))
+    return [wiki_replace(d, _worker_opencc) for d in pages if is_article(d)]
+
+def wiki_process_parallel(input_file, index_file, save_path, workers=None):
+    """
+    按多流索引并行解压、清理wiki文件，并按原始顺序写入，输出与 wiki_process 一致
+    :param input_file: 多流 bz2 文件路径
+    :param index_file: 多流索引文件路径（.txt 或 .txt.bz2）
+    :param save_path: 保存文件路径
+    :param workers: 进程数，默认使用全部CPU核心
+    """
+    workers = workers or os.cpu_count()
+    offsets = read_multistream_offsets(index_file)
+    # 第一个数据块之前是文件头，每个子进程都需要它来确定 XML 命名空间
+    header = read_stream(input_file, 0, offsets[0])
+    bounds = offsets + [os.path.getsize(input_file)]
+    tasks = [(input_file, header, start, end) for start, end in zip(bounds, bounds[1:])]
+
+    with codecs.open(save_path, 'w', encoding='utf-8') as f, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        i = 0
+        w = tqdm(total=len(offsets), desc=u'已获取0篇文章')
+        # 限制在途的数据块数量，按提交顺序取回结果，保证输出顺序确定
+        for articles in map_ordered(executor, _process_stream, tasks, workers * 4):
+            for s in articles:
+                f.write(s + '\n\n\n')
+                i += 1
+            w.update(1)
+            w.set_description(u'已获取%s篇文章' % i)
+        w.close()
+
 if __name__ == '__main__':
     # bz2文件路径
     input_file = "/home/amz/Downloads/zhwiki-latest-pages-articles.xml.bz2"
@@ -76,3 +155,8 @@ if __name__ == '__main__':
 
     # 处理并保存
     wiki_process(input_file, save_path)
+
+    # 使用多流版本时改为并行解析：
+    # input_file = "/home/amz/Downloads/zhwiki-latest-pages-articles-multistream.xml.bz2"
+    # index_file = "/home/amz/Downloads/zhwiki-latest-pages-articles-multistream-index.txt.bz2"
+    # wiki_process_parallel(input_file, index_file, save_path)
@@ -0,0 +1,300 @@
+"""
+基于词频的 DAG 最大概率分词，不依赖 jieba
+
+词表直接来自本项目自己的产物：分词词库.txt（语言模型构建 的 lexicon 阶段在 .gram 构建成功后
+保存的 merge1_2_3.txt 快照，词\t频次）和 zh_dicts/*.dict.yaml（词\t拼音\t权重），这样分词用的词表与最终发布的词库一致。
+词表编译成数组化的字典树：节点按层（同层按前缀的字典序）连续编号，每个节点的子边在 chars 中连续且按码位排序，
+第 k 条边指向节点 k + 1，因此只需 first（每个节点第一条子边的下标）、chars（子边的码位）、logp（对数概率）三个数组，
+查找子节点时在 chars[first[node]:first[node + 1]] 中二分。每个节点约 16 字节，没有逐边的 Python 对象，
+fork 出的子进程共享这些数组的内存页；编译结果按词表内容摘要缓存，下次直接加载。
+"""
+import os
+import glob
+import math
+import struct
+import hashlib
+import tempfile
+import re
+import shutil
+from array import array
+from bisect import bisect_left
+from 语料工具 import open_corpus, file_digest, strip_compression
+
+DICT_CACHE_DIR = '词典缓存'  # 编译后的字典树缓存目录，None 表示不缓存
+LEXICON_SNAPSHOT_FILE = '分词词库.txt'  # 项目词表：上一轮构建的 merge1_2_3.txt 快照，由 snapshot_lexicon 写出
+DEFAULT_FREQ = 1           # 词表中没有写频次的词按此频次计
+MAX_WORD_LENGTH = 16       # 超过此长度的词条不收录
+
+_NOT_WORD = float('-inf')
+_CACHE_HEADER = '<QQd'     # 缓存文件头：first 的长度、chars 的长度、未登录单字的对数概率  # 只是前缀、本身不成词的节点
+
+# 汉字连续片段用词典切分；其余片段中连续的字母数字成为一个词，其他非空白字符各自成词，
+# 换行符也作为单独的词输出，便于把多行拼成一段文本批量切分
+HAN_PATTERN = re.compile(r'([㐀-䶿一-鿿豈-﫿\U00020000-\U0002FA1F]+)')
+OTHER_TOKEN_PATTERN = re.compile(r'[a-zA-Z0-9+#&._%\-]+|\S|\n')
+
+# ========== 词表读取 ==========
+def iter_lexicon_entries(file_path):
+    """逐条返回词表中的 (词, 频次)。
+
+    支持 Rime 的 .dict.yaml（跳过 '...' 之前的文件头）、merge1_2_3.txt（词\t频次）
+    和 jieba 用户词典（词 频次 词性）；频次取词后面第一个纯数字字段。
+    """
+    with open_corpus(file_path) as f:
+        in_body = not is_rime_dict(file_path)
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not in_body:
+                in_body = line == '...'
+                continue
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split('\t') if '\t' in line else line.split()
+            word = parts[0].strip()
+            if not word or '$' in word or len(word) > MAX_WORD_LENGTH:
+                continue
+            freq = next((int(part) for part in parts[1:] if part.strip().isdigit()), DEFAULT_FREQ)
+            if freq > 0:
+                yield word, freq
+
+def is_rime_dict(file_path):
+    """是否为 Rime 词典文件（需要跳过文件头）。"""
+    return strip_compression(file_path).endswith('.dict.yaml')
+
+def default_lexicon_files():
+    """native 后端的默认词表：项目词表快照加上 zh_dicts 中的 Rime 词典，各分词入口共用。"""
+    return [LEXICON_SNAPSHOT_FILE] + sorted(glob.glob('zh_dicts/*.dict.yaml'))
+
+def snapshot_lexicon(merged_file, lexicon_file=LEXICON_SNAPSHOT_FILE):
+    """把合并结果（可压缩）保存为项目词表，返回快照内容是否有变化。
+
+    分词读的是快照而不是 merged_file：快照只在 .gram 构建成功后更新，merge 写到一半或构建失败时，
+    分词不会读到不完整或未发布的词表。快照内容一变，下一轮 native 分词及其后的阶段都会重新执行。
+    """
+    tmp_file = lexicon_file + '.tmp'
+    with open_corpus(merged_file, 'rb') as f_in, open(tmp_file, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, 16 * 1024 * 1024)
+    return commit_lexicon(tmp_file, lexicon_file)
+
+def commit_lexicon(tmp_file, lexicon_file=LEXICON_SNAPSHOT_FILE):
+    """用写好的临时文件替换项目词表；内容与现有快照相同时保留原文件，返回是否更新。
+
+    先写临时文件再替换，正在加载词表的分词进程不会读到写了一半的文件。
+    """
+    if os.path.isfile(lexicon_file) and file_digest(tmp_file) == file_digest(lexicon_file):
+        os.remove(tmp_file)
+        print(f"分词词库内容没有变化：{lexicon_file}")
+        return False
+    os.replace(tmp_file, lexicon_file)
+    print(f"分词词库已更新：{lexicon_file}")
+    return True
+
+def _read_array(f, typecode, count):
+    """从文件读出 count 个元素的数组：先分配数组再 readinto，避免 fromfile 产生同样大小的临时 bytes。"""
+    values = array(typecode, [0]) * count
+    if f.readinto(memoryview(values).cast('B')) != values.itemsize * count:
+        raise EOFError("缓存文件不完整")
+    return values
+
+# ========== 字典树 ==========
+class DagSegmenter:
+    """数组化字典树 + DAG 最大概率路径分词，汉字片段的切分规则与 jieba 关闭 HMM 时相同。"""
+
+    def __init__(self, first, chars, logp, min_logp):
+        self.first = first          # array('I')，节点 i 的子边为 chars[first[i]:first[i + 1]]，长度为节点数 + 1
+        self.chars = chars          # array('I')，子边的码位，同一节点内升序；第 k 条边指向节点 k + 1
+        self.logp = logp            # array('d')，节点对应词的对数概率，非词节点为 -inf
+        self.min_logp = min_logp    # 未登录单字的对数概率
+        # 根节点的子边最多（每个首字一条），单独放进字典；只有几万条，其余各层仍在数组中二分
+        self.root = {code: k + 1 for k, code in enumerate(chars[first[0]:first[1]], first[0])}
+
+    @classmethod
+    def from_frequencies(cls, word_freqs):
+        """由 {词: 频次} 编译字典树。
+
+        按层构建：第 d 层的节点是所有词长度为 d 的不同前缀，按字典序排列时同一父节点的子节点连续、
+        且父节点的先后与上一层一致，所以逐层追加即得到 "第 k 条边指向节点 k + 1" 的编号。
+        """
+        total = sum(word_freqs.values()) or 1
+        log_total = math.log(total)
+        first = array('I', [0])
+        chars = array('I')
+        logp = array('d', [_NOT_WORD])
+        words = sorted(word for word in word_freqs if word)
+        level = ['']
+        depth = 0
+        while level:
+            depth += 1
+            # 本层的不同前缀：词已排序，前缀序列也有序，去掉相邻重复即可
+            prefixes = []
+            previous = None
+            for word in words:
+                prefix = word[:depth]
+                if prefix != previous:
+                    prefixes.append(prefix)
+                    previous = prefix
+            # 上一层每个节点的子边数
+            j, count = 0, len(prefixes)
+            for parent in level:
+                start = j
+                while j < count and prefixes[j][:-1] == parent:
+                    j += 1
+                first.append(first[-1] + j - start)
+            chars.extend([ord(prefix[-1]) for prefix in prefixes])
+            freqs = map(word_freqs.get, prefixes)
+            logp.extend([math.log(freq) - log_total if freq else _NOT_WORD for freq in freqs])
+            words = [word for word in words if len(word) > depth]
+            level = prefixes
+        return cls(first, chars, logp, -log_total)
+
+    @classmethod
+    def from_files(cls, lexicon_files):
+        """读取若干词表文件，同一个词的频次累加（如多音字的各个读音）。"""
+        word_freqs = {}
+        for file_path in lexicon_files:
+            if not os.path.isfile(file_path):
+                print(f"警告：词表 {file_path} 不存在，已跳过。")
+                continue
+            for word, freq in iter_lexicon_entries(file_path):
+                word_freqs[word] = word_freqs.get(word, 0) + freq
+        print(f"已从 {len(lexicon_files)} 个词表收录 {len(word_freqs)} 个词。")
+        return cls.from_frequencies(word_freqs)
+
+    @classmethod
+    def load(cls, lexicon_files, cache_dir=DICT_CACHE_DIR):
+        """加载词表；cache_dir 中有相同内容摘要的编译结果时直接反序列化。"""
+        if not cache_dir:
+            return cls.from_files(lexicon_files)
+
+        cache_file = os.path.join(cache_dir, f"dag2.{lexicon_cache_key(lexicon_files)}.cache")
+        try:
+            with open(cache_file, 'rb') as f:
+                # 文件头记录两个数组的长度和未登录字概率，数组直接读入，不经过中间的 bytes 对象
+                first_len, chars_len, min_logp = struct.unpack(_CACHE_HEADER, f.read(struct.calcsize(_CACHE_HEADER)))
+                first = _read_array(f, 'I', first_len)
+                chars = _read_array(f, 'I', chars_len)
+                logp = _read_array(f, 'd', first_len - 1)
+            print(f"已从缓存加载分词词表：{cache_file}")
+            return cls(first, chars, logp, min_logp)
+        except (OSError, EOFError, ValueError, struct.error):
+            pass
+
+        segmenter = cls.from_files(lexicon_files)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(struct.pack(_CACHE_HEADER, len(segmenter.first), len(segmenter.chars), segmenter.min_logp))
+            segmenter.first.tofile(f)
+            segmenter.chars.tofile(f)
+            segmenter.logp.tofile(f)
+        os.replace(tmp_path, cache_file)
+        print(f"分词词表缓存已写入：{cache_file}")
+        return segmenter
+
+    def _child(self, node, code):
+        """节点 node 经码位 code 到达的子节点，没有时返回 None。"""
+        lo, hi = self.first[node], self.first[node + 1]
+        k = bisect_left(self.chars, code, lo, hi)
+        return k + 1 if k < hi and self.chars[k] == code else None
+
+    def word_logp(self, word):
+        """词的对数概率，不在词表中返回 None。"""
+        node = 0
+        for ch in word:
+            node = self._child(node, ord(ch))
+            if node is None:
+                return None
+        value = self.logp[node]
+        return None if value == _NOT_WORD else value
+
+    # ---------- 切分 ----------
+    def _dag(self, sentence):
+        """DAG[i] 为以 i 开头的所有词的 (结束位置, 对数概率)；没有任何词时只含单字本身。"""
+        first, chars, logp, min_logp, root = self.first, self.chars, self.logp, self.min_logp, self.root
+        codes = [ord(ch) for ch in sentence]
+        n = len(codes)
+        dag = []
+        for i in range(n):
+            ends = []
+            node = root.get(codes[i])
+            if node is None:
+                dag.append([(i + 1, min_logp)])
+                continue
+            j = i + 1
+            if logp[node] != _NOT_WORD:
+                ends.append((j, logp[node]))
+            while j < n:
+                # 在 node 的子边中二分查找下一个字，内联 _child 以减少调用开销
+                lo, hi = first[node], first[node + 1]
+                if lo == hi:
+                    break
+                code = codes[j]
+                k = bisect_left(chars, code, lo, hi)
+                if k == hi or chars[k] != code:
+                    break
+                node = k + 1
+                j += 1
+                p = logp[node]
+                if p != _NOT_WORD:
+                    ends.append((j, p))
+            dag.append(ends or [(i + 1, min_logp)])
+        return dag
+
+    def _cut_han(self, sentence):
+        """最大概率路径（与 jieba 相同：同分时取更长的词）。"""
+        dag = self._dag(sentence)
+        n = len(sentence)
+        route = [(0.0, 0)] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            route[i] = max((p + route[end][0], end) for end, p in dag[i])
+        i = 0
+        while i < n:
+            end = route[i][1]
+            yield sentence[i:end]
+            i = end
+
+    def _cut_han_all(self, sentence):
+        """全模式：输出所有词典中的词，与 jieba 的 cut_all 规则相同。"""
+        last_end = 0
+        for i, ends in enumerate(self._dag(sentence)):
+            if len(ends) == 1 and i >= last_end:
+                last_end = ends[0][0]
+                yield sentence[i:last_end]
+                continue
+            for end, _ in ends:
+                if end > i + 1:
+                    yield sentence[i:end]
+                    last_end = end
+
+    def _cut_han_search(self, sentence):
+        """搜索引擎模式：在精确切分的基础上，长词再输出其中的二字、三字词。"""
+        for word in self._cut_han(sentence):
+            for size in (2, 3):
+                if len(word) > size:
+                    for i in range(len(word) - size + 1):
+                        gram = word[i:i + size]
+                        if self.word_logp(gram) is not None:
+                            yield gram
+            yield word
+
+    def cut(self, line, mode='precise'):
+        """切分一行，返回词的迭代器；mode 为 'precise' / 'full' / 'search'。"""
+        cut_han = {'precise': self._cut_han, 'full': self._cut_han_all, 'search': self._cut_han_search}[mode]
+        for block in HAN_PATTERN.split(line):
+            if not block:
+                continue
+            if HAN_PATTERN.fullmatch(block):
+                yield from cut_han(block)
+            else:
+                yield from OTHER_TOKEN_PATTERN.findall(block)
+
+    def lcut(self, line, mode='precise'):
+        return list(self.cut(line, mode))
+
+def lexicon_cache_key(lexicon_files):
+    """由各词表的文件名和内容摘要计算缓存键。"""
+    key = hashlib.blake2b(digest_size=16)
+    for file_path in lexicon_files:
+        key.update(os.path.basename(file_path).encode('utf-8'))
+        key.update(file_digest(file_path).encode('utf-8') if os.path.isfile(file_path) else b'-')
+    return key.hexdigest()
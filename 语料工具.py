@@ -0,0 +1,162 @@
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import queue
+import threading
+from collections import deque
+from itertools import islice
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：pip install zstandard
+    zstandard = None
+
+# ========== 文件分片 ==========
+def split_file_shards(file_path, shard_size=64 * 1024 * 1024):
+    """按字节范围把文件切成若干分片，分片边界总是落在换行符之后。"""
+    shards = []
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        start = 0
+        while start < file_size:
+            f.seek(min(start + shard_size, file_size))
+            f.readline()  # 补齐到行尾，保证不会把一行拆到两个分片
+            end = min(f.tell(), file_size)
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def read_shard_lines(file_path, start, end, encoding='utf-8'):
+    """读取一个分片并逐行返回，换行符处理与文本模式 open() 完全一致。"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+
+
+# ========== 有序并行 ==========
+def map_ordered(executor, func, tasks, window):
+    """把任务提交到进程池并按提交顺序逐个返回结果。
+
+    同时在途的任务数不超过 window：结果被取走后才提交下一个任务，
+    消费方（写文件）变慢时上游自然停下，避免结果堆积占满内存。
+    """
+    task_iter = iter(tasks)
+    pending = deque(executor.submit(func, task) for task in islice(task_iter, window))
+    while pending:
+        result = pending.popleft().result()
+        task = next(task_iter, None)
+        if task is not None:
+            pending.append(executor.submit(func, task))
+        yield result
+
+
+# ========== 内容指纹 ==========
+def file_digest(file_path, block_size=4 * 1024 * 1024):
+    """计算文件内容的 blake2b 摘要（十六进制字符串）。"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ========== 压缩读写 ==========
+def _open_zstd(path, mode):
+    if zstandard is None:
+        raise RuntimeError(f"读写 {path} 需要安装 zstandard：pip install zstandard")
+    if 'r' in mode:
+        return zstandard.open(path, mode)
+    return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=3))
+
+# 按扩展名选择压缩格式，压缩级别偏向速度，适合中间文件
+COMPRESSION_OPENERS = {
+    '.gz': lambda path, mode: gzip.open(path, mode, compresslevel=6),
+    '.bz2': lambda path, mode: bz2.open(path, mode),
+    '.xz': lambda path, mode: lzma.open(path, mode, preset=None if 'r' in mode else 3),
+    '.zst': _open_zstd,
+}
+
+def compression_of(path):
+    """返回文件的压缩扩展名，未压缩时返回空字符串。"""
+    ext = os.path.splitext(path)[1].lower()
+    return ext if ext in COMPRESSION_OPENERS else ''
+
+def strip_compression(path):
+    """去掉压缩扩展名，例如 语料.txt.gz -> 语料.txt。"""
+    return path[:-len(compression_of(path))] if compression_of(path) else path
+
+class _ReadAheadRaw(io.RawIOBase):
+    """在后台线程中读取（解压）数据块，放入有界队列，让解压与后续处理并行。"""
+
+    def __init__(self, fileobj, chunk_size=1024 * 1024, depth=8):
+        super().__init__()
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._buffer = b''
+        self._eof = False
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            while True:
+                chunk = self._fileobj.read(self._chunk_size)
+                if not self._put(chunk) or not chunk:
+                    return
+        except Exception as e:  # 异常交给读取方抛出
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+            self._buffer = item
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._fileobj.close()
+        super().close()
+
+def open_corpus(path, mode='r', encoding='utf-8', readahead=True):
+    """按扩展名透明读写 gzip/bz2/xz/zstd 压缩文件，未压缩文件等同于 open()。
+
+    支持 'r'、'w'、'a' 及对应的二进制模式；读取压缩文件时默认在后台线程解压。
+    """
+    binary = 'b' in mode
+    codec = compression_of(path)
+    if not codec:
+        return open(path, mode) if binary else open(path, mode, encoding=encoding)
+
+    raw_mode = mode.replace('t', '').replace('b', '') + 'b'
+    fileobj = COMPRESSION_OPENERS[codec](path, raw_mode)
+    if raw_mode == 'rb' and readahead:
+        fileobj = io.BufferedReader(_ReadAheadRaw(fileobj), buffer_size=1024 * 1024)
+    return fileobj if binary else io.TextIOWrapper(fileobj, encoding=encoding)
@@ -1,31 +1,112 @@
 import os
 import re
+import json
+import hashlib
+import mmap
+import time
+from array import array
 import regex
 import tempfile
 import shutil
 import jieba
 import math
 import subprocess
+import contextlib
+import bisect
+import sys
+import threading
 from tqdm import tqdm
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
+from itertools import islice, filterfalse, chain, repeat
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，阶段报告中不统计峰值内存
+    resource = None
+from n元计数 import count_ngrams, RunCounter
+from n元索引 import build_index
+from 词典分词 import (DagSegmenter, HAN_PATTERN, lexicon_cache_key, default_lexicon_files, snapshot_lexicon,
+                  commit_lexicon, LEXICON_SNAPSHOT_FILE)
+from 语料工具 import (split_file_shards, read_shard_lines, file_digest, open_corpus, compression_of,
+                   strip_compression, map_ordered)
 
 # ========== 配置文件路径 ==========
+INTERMEDIATE_CODEC = ''    # 中间文件压缩格式：'' 不压缩 / '.gz' / '.bz2' / '.xz' / '.zst'（需安装 zstandard）
 ARPA_FILE = 'log.arpa'
-PROCESSED_CORPUS_FILE = '清理后.txt'
-SEGMENTED_FILE = '分词后.txt'
-merged_file = 'merge1_2_3.txt'
+PROCESSED_CORPUS_FILE = '清理后.txt' + INTERMEDIATE_CODEC
+SEGMENTED_FILE = '分词后.txt' + INTERMEDIATE_CODEC
+merged_file = 'merge1_2_3.txt' + INTERMEDIATE_CODEC
+TIER_MERGED_TEMPLATE = 'merge_{}.txt' + INTERMEDIATE_CODEC   # 各档尺寸模型的合并文件，如 merge_n3m1.txt
 language = 'zh-hans'
 RAW_CORPUS_DIR = '语料输入'
 STOPWORDS_DIR = '停用词表'
 SUPPORTED_FORMATS = ['.txt', '.yaml', '.csv', '.json', '.jsonl']
 
+# ========== 并行预处理配置 ==========
+PREPROCESS_WORKERS = 1                      # 预处理进程数，1 表示单进程
+PREPROCESS_SHARD_SIZE = 64 * 1024 * 1024    # 每个分片的字节数（按行对齐）
+
+# ========== 流式处理配置 ==========
+FUSED_PIPELINE = False                      # 预处理结果直接送入分词，不写出清理后.txt（调试时关闭）
+FUSED_WORKERS = os.cpu_count() or 1         # 流式清洗分词的进程数
+
+# ========== 增量构建配置 ==========
+INCREMENTAL_BUILD = False                   # 开启后按文件缓存清洗、分词结果，只处理新增或改动的语料
+CORPUS_CACHE_DIR = '语料缓存'
+MANIFEST_FILE = os.path.join(CORPUS_CACHE_DIR, 'manifest.json')
+
+# ========== 句子去重配置 ==========
+DEDUP_ENABLED = False                       # 在预处理和分词之间去掉重复的句子
+DEDUP_MODE = 'spill'                        # 'spill' 精确去重（指纹分桶落盘）/ 'bloom' 布隆过滤器（单遍，极少量误删）
+DEDUPED_CORPUS_FILE = '去重后.txt' + INTERMEDIATE_CODEC
+DEDUP_BUCKET_BYTES = 64 * 1024 * 1024       # spill 模式下每个分桶大约对应的输入字节数
+DEDUP_BLOOM_BYTES = 1024 * 1024 * 1024      # bloom 模式的位数组大小
+DEDUP_BLOOM_HASHES = 7                      # bloom 模式的哈希函数个数
+
+# ========== 阶段调度配置 ==========
+STAGE_STATE_FILE = '构建状态.json'          # 记录每个阶段的输入指纹和输出，用于跳过已是最新的阶段
+STAGE_REPORT_FILE = '构建报告.json'         # 每个阶段的耗时和峰值内存
+
+# ========== n-gram 计数配置 ==========
+NGRAM_COUNTER = 'lmplz'     # 'lmplz' 生成 ARPA 后换算频次 / 'native' 内建计数，直接写出精确频次（不需要 KenLM）
+NGRAM_PRUNE = (0, 75, 300)  # 剪枝阈值：各阶频次不大于阈值的 n-gram 被丢弃，lmplz（--prune）和 native 计数共用
+ARPA_INDEX_ENABLED = False  # 生成 ARPA 后编译二进制 n-gram 索引，供 n元索引.NgramIndex 直接查询概率
+ARPA_INDEX_FILE = ARPA_FILE + '.idx'
+
+# ========== 多档尺寸模型配置 ==========
+SIZE_TIERS_ENABLED = False                        # 在同一份 n-gram 频次上一次性生成各档尺寸的 .gram（m1/m2/m3）
+SIZE_TIERS = {'m1': 100, 'm2': 200, 'm3': 300}    # 档位名: 目标 .gram 大小（MB）
+SIZE_TIER_ORDERS = (2, 3)                         # 每个档位分别生成的模型阶数（n2 / n3）
+SIZE_TIER_WEIGHTS = (0, 1, 4)                     # 各阶剪枝阈值的比例（1 阶不剪枝），搜索时按比例放大
+GRAM_SIZE_RATIO = 1.0                             # .gram 大小与合并文本大小之比的估计值，可用一次实际构建校准
+# 各档的阈值在未剪枝的精确频次上规划，不与 NGRAM_PRUNE 叠加：native 计数在同一遍中另外写出未剪枝的频次，
+# lmplz 计数时另加一个阶段从 分词后.txt 统计；LMPLZ_STREAM_INPUT 没有分词文件，只能退回到
+# 已按 NGRAM_PRUNE 剪枝、由 ARPA 换算的近似频次，此时各档的阈值叠加在 NGRAM_PRUNE 之上。
+# 未剪枝的高阶 n-gram 文件可能比剪枝后大很多，注意磁盘空间。
+TIER_NGRAM_FILE_TEMPLATE = "ngram_full_{}_.txt" + INTERMEDIATE_CODEC
+
+# ========== KenLM 配置 ==========
+LMPLZ_STREAM_INPUT = False                       # 分词结果直接送入 lmplz 标准输入，不写出 分词后.txt
+LMPLZ_MEMORY_FRACTION = 0.6                      # lmplz -S 取当前可用内存的比例（流式输入时分词也在同时运行）
+LMPLZ_MIN_MEMORY_MB = 1024                       # -S 的下限
+LMPLZ_FALLBACK_MEMORY = '4G'                     # 无法读取可用内存时的 -S
+LMPLZ_TMP_DIR = os.path.expanduser('~/ARPAtmp')  # lmplz -T 的上级目录，每次运行在其中建立独立的子目录
+
 # n-gram 文件名模板
-NGRAM_FILE_TEMPLATE = "ngram_{}_.txt"
+NGRAM_FILE_TEMPLATE = "ngram_{}_.txt" + INTERMEDIATE_CODEC
 NGRAM_FILES = [NGRAM_FILE_TEMPLATE.format(i) for i in range(1, 4)]
 
 # ========== 分词和停用词配置 ==========
 STOPWORDS_ENABLED = False    #开启或者关闭停用词表
 SEGMENT_MODE = 'accurate'   #请选择 'accurate' / 'all' / 'search'
+SEGMENT_BACKEND = 'jieba'   #请选择 'jieba' / 'native'（基于项目词表的 DAG 最大概率分词，不使用 HMM）
+# native 后端的词表：分词词库.txt 为最近一次成功构建 .gram 时 merge1_2_3.txt 的快照，
+# 不直接读 merged_file，merge 写到一半或 .gram 构建失败时分词不会用到这份合并结果；
+# 快照内容变化后（合并结果通常每轮都会变），下一轮 native 分词及其后的阶段都会重新执行
+SEGMENT_LEXICON_FILES = default_lexicon_files()
+LEXICON_SNAPSHOT_ENABLED = True   # SEGMENT_BACKEND = 'native' 时，.gram 构建成功后把合并结果保存为 分词词库.txt
+SEGMENT_CACHE_SIZE = 100000   #分词结果缓存的片段数（按标点切开的短句），0 表示不缓存
 
 # ========== 停用词加载 ==========
 def load_stopwords_from_directory(directory):
@@ -61,91 +142,566 @@ def configure_jieba():
 configure_jieba()
 
 # ========== 语料预处理 ==========
-def preprocess_corpus(input_dirs, output_file, max_length=30, chunk_size=10000):
-    """处理多个输入目录中的文件，并按块写入磁盘，优化内存使用。"""
+def iter_corpus_files(input_dirs):
+    """按固定顺序遍历输入目录中所有支持格式的语料文件。"""
+    for input_dir in input_dirs:
+        for root, _, files in os.walk(input_dir):
+            for file in files:
+                # 压缩的语料（如 xxx.txt.gz）按去掉压缩扩展名后的格式判断
+                if any(strip_compression(file).endswith(ext) for ext in SUPPORTED_FORMATS):
+                    yield os.path.join(root, file)
+
+def clean_line_chain(line, max_length=30):
+    """逐条正则清洗单行语料（原始实现，保留作对照基准）。"""
     pattern = r'[^\p{Script=Han}\n]'  # 匹配所有非汉字和非换行符
-    with open(output_file, 'w', encoding='utf-8') as f_out:
+    # 第一步：符号替换，逗号替换为空格
+    line = re.sub(r'[。.！!?？]', '\n', line)
+    #line = re.sub(r'，', ' ', line)
+    line = re.sub(r'来源": "zhihu', '', line)
+    # 第二步：特定关键词替换为换行符
+    line = re.sub(r'\b(title|category|})\b', '\n', line)
+    line = re.sub(r'"id":\s*".*?",\s*"问":\s*".*?"', '', line)
+    # 第三步：只保留 CJK 汉字和换行符
+    line = regex.sub(pattern, '', line) 
+    # 第四步：去掉所有空行
+    lines = [l for l in line.split('\n') if l.strip()]
+    # 第五步：将行长度超过30的部分截断
+    result = []
+    for l in lines:
+        while len(l) > max_length:
+            result.append(l[:max_length] + '\n')
+            l = l[max_length:]
+        if l:
+            result.append(l + '\n')
+    return result
+
+# ---------- 单遍清洗引擎 ----------
+# 逐条 re.sub 的做法每行要扫描七遍文本。下面把标点断句、关键词剔除、汉字过滤合并成
+# 一个预编译正则，一次 findall 得到所有有效片段，结果与 clean_line_chain 逐字节一致：
+#   - 标点和 \b 边界内的 title/category/} 都起断行作用；
+#   - "id"/"问" 片段整体删除，其中的 \s 可以跨过上面两类断行符，. 则不能；
+#   - 其余非汉字字符直接跳过。
+BREAK_CHARS = '。.！!?？\n'
+
+def _han_char_class():
+    """用 regex 的 \p{Script=Han} 生成等价的 re 字符集，保证与原实现的汉字判定一致。"""
+    han = regex.findall(r'\p{Script=Han}', ''.join(map(chr, range(0x110000))))
+    ranges = []
+    for ch in han:
+        cp = ord(ch)
+        if ranges and ranges[-1][1] == cp - 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ''.join(f'\\U{lo:08x}-\\U{hi:08x}' for lo, hi in ranges)
+
+_KEYWORD = r'\b(?:title|category|\})\b'
+_SPACE = rf'(?:\s|[{BREAK_CHARS}]|{_KEYWORD})'
+_ANY = rf'(?:(?!{_KEYWORD})[^{BREAK_CHARS}])'
+CLEAN_TOKEN_PATTERN = re.compile(
+    rf'[{_han_char_class()}]+'
+    rf'|[{BREAK_CHARS}]'
+    rf'|{_KEYWORD}'
+    rf'|"id":{_SPACE}*"{_ANY}*?",{_SPACE}*"问":{_SPACE}*"{_ANY}*?"'
+)
+LINE_BREAK_TOKENS = frozenset(BREAK_CHARS) | {'title', 'category', '}'}
+
+def clean_line(line, max_length=30):
+    """清洗单行语料，返回截断后的若干行（每行带换行符）。"""
+    segments = []
+    current = []
+    for token in CLEAN_TOKEN_PATTERN.findall(line.replace('来源": "zhihu', '')):
+        if token in LINE_BREAK_TOKENS:
+            if current:
+                segments.append(''.join(current))
+                current = []
+        elif token[0] != '"':
+            current.append(token)
+    if current:
+        segments.append(''.join(current))
+
+    # 将行长度超过 max_length 的部分截断
+    result = []
+    for l in segments:
+        while len(l) > max_length:
+            result.append(l[:max_length] + '\n')
+            l = l[max_length:]
+        result.append(l + '\n')
+    return result
+
+def preprocess_corpus(input_dirs, output_file, max_length=30, chunk_size=10000, workers=PREPROCESS_WORKERS):
+    """处理多个输入目录中的文件，并按块写入磁盘，优化内存使用。
+
+    workers 大于 1 时按分片多进程清洗，输出与单进程逐字节一致。
+    """
+    clean_files(list(iter_corpus_files(input_dirs)), output_file, max_length, chunk_size, workers)
+
+def clean_files(file_paths, output_file, max_length=30, chunk_size=10000, workers=PREPROCESS_WORKERS):
+    """按顺序清洗给定的语料文件，结果写入同一个输出文件。"""
+    if workers > 1:
+        _clean_files_parallel(file_paths, output_file, max_length, workers)
+        return
+
+    with open_corpus(output_file, 'w') as f_out:
         buffer = []
-        for input_dir in input_dirs:
-            for root, _, files in os.walk(input_dir):
-                for file in files:
-                    if any(file.endswith(ext) for ext in SUPPORTED_FORMATS):
-                        with open(os.path.join(root, file), 'r', encoding='utf-8') as f_in:
-                            for line in tqdm(f_in, desc=f"处理 {file}"):
-                                # 第一步：符号替换，逗号替换为空格
-                                line = re.sub(r'[。.！!?？]', '\n', line)
-                                #line = re.sub(r'，', ' ', line)
-                                line = re.sub(r'来源": "zhihu', '', line)
-                                # 第二步：特定关键词替换为换行符
-                                line = re.sub(r'\b(title|category|})\b', '\n', line)
-                                line = re.sub(r'"id":\s*".*?",\s*"问":\s*".*?"', '', line)
-                                # 第三步：只保留 CJK 汉字和换行符
-                                line = regex.sub(pattern, '', line) 
-                                # 第四步：去掉所有空行
-                                lines = [l for l in line.split('\n') if l.strip()]
-                                # 第五步：将行长度超过30的部分截断
-                                for l in lines:
-                                    while len(l) > max_length:
-                                        buffer.append(l[:max_length] + '\n')
-                                        l = l[max_length:]
-                                    if l:
-                                        buffer.append(l + '\n')
-                                if len(buffer) >= chunk_size:
-                                    f_out.writelines(buffer)
-                                    buffer.clear()
+        for file_path in file_paths:
+            with open_corpus(file_path) as f_in:
+                for line in tqdm(f_in, desc=f"处理 {os.path.basename(file_path)}"):
+                    buffer.extend(clean_line(line, max_length))
+                    if len(buffer) >= chunk_size:
+                        f_out.writelines(buffer)
+                        buffer.clear()
         if buffer:
             f_out.writelines(buffer)
 
+def _shard_tasks(file_paths, max_length):
+    """把每个文件切成按行对齐的分片；压缩文件无法按字节范围切分，整个文件作为一个分片。"""
+    return [(file_path, start, end, max_length)
+            for file_path in file_paths
+            for start, end in (split_file_shards(file_path, PREPROCESS_SHARD_SIZE)
+                               if not compression_of(file_path) else [(None, None)])]
+
+def _shard_lines(file_path, start, end):
+    return open_corpus(file_path) if start is None else read_shard_lines(file_path, start, end)
+
+def _clean_shard(task):
+    """子进程任务：清洗一个分片，返回清洗后的文本。"""
+    file_path, start, end, max_length = task
+    buffer = []
+    with _shard_lines(file_path, start, end) as lines:
+        for line in lines:
+            buffer.extend(clean_line(line, max_length))
+    return ''.join(buffer)
+
+def _clean_files_parallel(file_paths, output_file, max_length, workers):
+    """把每个文件切成按行对齐的分片，用进程池清洗后按输入顺序写回。"""
+    tasks = _shard_tasks(file_paths, max_length)
+    with open_corpus(output_file, 'w') as f_out, \
+         ProcessPoolExecutor(max_workers=workers) as executor:
+        for text in tqdm(map_ordered(executor, _clean_shard, tasks, workers * 2),
+                         total=len(tasks), desc=f"分片清洗（{workers} 进程）"):
+            f_out.write(text)
+
+# ========== 句子去重 ==========
+def line_fingerprint(line):
+    """计算一行（bytes，不含换行符）的 64 位指纹。"""
+    return int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), 'little')
+
+def dedup_corpus(input_file, output_file, mode=DEDUP_MODE):
+    """去掉语料中的重复行，保留每行第一次出现的位置，返回 (总行数, 保留行数)。
+
+    spill 模式把 (指纹, 行号) 按指纹分桶写入临时文件，逐桶找出重复行并记录在磁盘位图上，
+    再顺序读一遍输入写出保留的行；内存只与单个分桶大小有关。
+    bloom 模式只读一遍输入，内存固定为位数组大小，但会以很低的概率误删不重复的行。
+    """
+    if mode == 'spill':
+        total, kept = _dedup_spill(input_file, output_file)
+    elif mode == 'bloom':
+        total, kept = _dedup_bloom(input_file, output_file)
+    else:
+        raise ValueError("未知的去重模式，请选择 'spill' / 'bloom'")
+    ratio = (total - kept) / total if total else 0.0
+    print(f"去重完成：{total} 行 -> {kept} 行，去重率 {ratio:.2%}")
+    return total, kept
+
+def _dedup_spill(input_file, output_file, flush_size=1 << 16):
+    """精确去重：指纹分桶落盘 + 磁盘位图。"""
+    bucket_count = max(1, min(512, os.path.getsize(input_file) // DEDUP_BUCKET_BYTES))
+    tmp_dir = tempfile.mkdtemp(prefix='dedup_', dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        # 第一遍：计算指纹，(指纹, 行号) 按桶写入临时文件，同一桶内行号递增
+        bucket_files = [open(os.path.join(tmp_dir, f'{i}.bin'), 'wb') for i in range(bucket_count)]
+        buffers = [array('Q') for _ in range(bucket_count)]
+        total = 0
+        with open_corpus(input_file, 'rb') as f_in:
+            for line in tqdm(f_in, desc="计算句子指纹"):
+                fingerprint = line_fingerprint(line.rstrip(b'\r\n'))
+                bucket = fingerprint % bucket_count
+                buffers[bucket].append(fingerprint)
+                buffers[bucket].append(total)
+                total += 1
+                if len(buffers[bucket]) >= flush_size:
+                    buffers[bucket].tofile(bucket_files[bucket])
+                    del buffers[bucket][:]
+        for buffer, bucket_file in zip(buffers, bucket_files):
+            buffer.tofile(bucket_file)
+            bucket_file.close()
+        del buffers
+
+        # 逐桶找出重复行，记录到磁盘位图
+        bitmap_path = os.path.join(tmp_dir, 'duplicates.bitmap')
+        with open(bitmap_path, 'wb') as f_bitmap:
+            f_bitmap.truncate(max(1, (total + 7) // 8))
+        with open(bitmap_path, 'r+b') as f_bitmap, mmap.mmap(f_bitmap.fileno(), 0) as bitmap:
+            for i in tqdm(range(bucket_count), desc="查找重复句子"):
+                bucket_path = os.path.join(tmp_dir, f'{i}.bin')
+                records = array('Q')
+                with open(bucket_path, 'rb') as f_bucket:
+                    records.frombytes(f_bucket.read())
+                os.remove(bucket_path)
+                seen = set()
+                for fingerprint, index in zip(records[::2], records[1::2]):
+                    if fingerprint in seen:
+                        bitmap[index >> 3] |= 1 << (index & 7)
+                    else:
+                        seen.add(fingerprint)
+
+            # 第二遍：写出未标记的行
+            kept = 0
+            with open_corpus(input_file, 'rb') as f_in, open_corpus(output_file, 'wb') as f_out:
+                for index, line in enumerate(tqdm(f_in, total=total, desc="写出去重结果")):
+                    if not bitmap[index >> 3] & (1 << (index & 7)):
+                        f_out.write(line)
+                        kept += 1
+        return total, kept
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _dedup_bloom(input_file, output_file):
+    """近似去重：布隆过滤器，单遍读写。"""
+    bit_count = DEDUP_BLOOM_BYTES * 8
+    bits = bytearray(DEDUP_BLOOM_BYTES)
+    total = kept = 0
+    with open_corpus(input_file, 'rb') as f_in, open_corpus(output_file, 'wb') as f_out:
+        for line in tqdm(f_in, desc="布隆过滤去重"):
+            total += 1
+            fingerprint = line_fingerprint(line.rstrip(b'\r\n'))
+            # 双重哈希：由 64 位指纹的高低两半派生出 k 个位置
+            h1, h2 = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+            seen = True
+            for i in range(DEDUP_BLOOM_HASHES):
+                pos = (h1 + i * h2) % bit_count
+                if not bits[pos >> 3] & (1 << (pos & 7)):
+                    seen = False
+                    bits[pos >> 3] |= 1 << (pos & 7)
+            if not seen:
+                f_out.write(line)
+                kept += 1
+    return total, kept
+
 # ========== 分词处理 ==========
+_native_segmenter = None
+
+def prepare_segmenter():
+    """native 后端在主进程加载词表，fork 出的子进程直接继承；jieba 后端已在导入时初始化。"""
+    global _native_segmenter
+    if SEGMENT_BACKEND == 'native' and _native_segmenter is None:
+        _native_segmenter = DagSegmenter.load(SEGMENT_LEXICON_FILES)
+
+def segmenter_params():
+    """影响分词结果的后端参数，写入阶段指纹和增量缓存参数。"""
+    if SEGMENT_BACKEND == 'native':
+        return {'backend': 'native', 'lexicon': lexicon_cache_key(SEGMENT_LEXICON_FILES)}
+    return {'backend': 'jieba'}
+
+# 批量分词时各行用换行符拼接后一次切分：换行符是分词器的分隔符，词不会跨行，
+# 切分结果用空格拼接后，换行符两侧各有一个拼接用的空格，去掉即得到逐行结果
+LINE_JOIN_PATTERN = re.compile(' ?\n ?')
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def _cut_block(block, backend):
+    """切分一个片段。分词器对每个片段独立切分，结果与上下文无关，可以直接缓存。"""
+    if backend == 'native':
+        return tuple(_native_segmenter.cut(block))
+    return tuple(jieba.cut(block, HMM=True))
+
+def segment_lines(lines):
+    """批量分词：每行去掉首尾空白后分词，词之间用空格分隔，每行输出一行（含换行符），返回拼接后的文本。
+
+    整批文本按分词器自己的规则切成片段（jieba 的 re_han_default / native 的 HAN_PATTERN），
+    逐片段查缓存，短行语料中大量重复的短句只切分一次；停用词用 filterfalse 在 C 层过滤，
+    输出只做一次 join 和一次替换，不再为每行单独拼接字符串。
+    """
+    if not lines:
+        return ''
+    text = '\n'.join([line.strip() for line in lines])
+    if SEGMENT_BACKEND == 'native':
+        prepare_segmenter()
+        blocks = HAN_PATTERN.split(text)
+    else:
+        blocks = jieba.re_han_default.split(text)
+    words = chain.from_iterable(map(_cut_block, blocks, repeat(SEGMENT_BACKEND)))
+    if STOPWORDS_ENABLED:
+        words = filterfalse(STOPWORDS.__contains__, words)
+    return LINE_JOIN_PATTERN.sub('\n', ' '.join(words)) + '\n'
+
 def segment_corpus(input_file, output_file, chunk_size=10000):
     """对语料进行分词，并保存为输出文件。"""
-    with open(input_file, 'r', encoding='utf-8') as f_in, \
-         open(output_file, 'w', encoding='utf-8') as f_out:
-        buffer = []
-        for line in tqdm(f_in, desc="分词处理中"):
-            words = jieba.lcut(line.strip(), HMM=True)
-            if STOPWORDS_ENABLED:
-                words = [word for word in words if word not in STOPWORDS]
-            buffer.append(' '.join(words) + '\n')
-            if len(buffer) >= chunk_size:
-                f_out.writelines(buffer)
-                buffer.clear()
-        if buffer:
-            f_out.writelines(buffer)
+    with open_corpus(output_file, 'w') as f_out:
+        f_out.writelines(iter_segment_corpus(input_file, chunk_size))
+
+def iter_segment_corpus(input_file, chunk_size=10000):
+    """逐批返回语料的分词结果文本，可直接写文件或送入 lmplz 的标准输入。"""
+    prepare_segmenter()
+    with open_corpus(input_file) as f_in:
+        batches = iter(lambda: list(islice(f_in, chunk_size)), [])
+        for lines in tqdm(batches, desc=f"分词处理中（每批 {chunk_size} 行）"):
+            yield segment_lines(lines)
+
+# ========== 流式预处理 + 分词 ==========
+def preprocess_and_segment(input_dirs, output_file, max_length=30, chunk_size=10000, workers=FUSED_WORKERS):
+    """清洗后的行直接交给分词，不写出清理后.txt，结果与 preprocess_corpus + segment_corpus 逐字节一致。"""
+    with open_corpus(output_file, 'w') as f_out:
+        f_out.writelines(iter_preprocess_and_segment(input_dirs, max_length, chunk_size, workers))
+
+def iter_preprocess_and_segment(input_dirs, max_length=30, chunk_size=10000, workers=FUSED_WORKERS):
+    """逐块返回清洗并分词后的文本。
+
+    多进程时每个子进程对一个分片先清洗再分词，清洗结果不离开子进程；
+    主进程按顺序返回分词结果，在途分片数有上限，消费方跟不上时自动限流。
+    """
+    file_paths = list(iter_corpus_files(input_dirs))
+    prepare_segmenter()
+    if workers > 1:
+        tasks = _shard_tasks(file_paths, max_length)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from tqdm(map_ordered(executor, _clean_and_segment_shard, tasks, workers * 2),
+                            total=len(tasks), desc=f"清洗并分词（{workers} 进程）")
+        return
+
+    buffer = []
+    for file_path in file_paths:
+        with open_corpus(file_path) as f_in:
+            for line in tqdm(f_in, desc=f"清洗并分词 {os.path.basename(file_path)}"):
+                buffer.extend(clean_line(line, max_length))
+                if len(buffer) >= chunk_size:
+                    yield segment_lines(buffer)
+                    buffer.clear()
+    yield segment_lines(buffer)
+
+def _clean_and_segment_shard(task):
+    """子进程任务：清洗并分词一个分片，返回分词后的文本。"""
+    file_path, start, end, max_length = task
+    buffer = []
+    with _shard_lines(file_path, start, end) as lines:
+        for line in lines:
+            buffer.extend(clean_line(line, max_length))
+    return segment_lines(buffer)
+
+# ========== 增量清洗与分词 ==========
+def load_manifest(manifest_file):
+    """读取语料缓存清单，不存在或损坏时返回空清单。"""
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(manifest, manifest_file):
+    """先写临时文件再替换，避免中途退出留下半个清单。"""
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_file, manifest_file)
+
+def _cache_params(max_length):
+    """影响缓存结果的参数，清洗和分词分开记录：只有分词参数变化时，已清洗的文件仍可复用。"""
+    stopwords = hashlib.blake2b('\n'.join(sorted(STOPWORDS)).encode('utf-8'), digest_size=8).hexdigest()
+    return {'clean': {'max_length': max_length},
+            'segment': {'stopwords_enabled': STOPWORDS_ENABLED, 'stopwords': stopwords, **segmenter_params()}}
+
+def build_segmented_incremental(input_dirs, output_file, max_length=30, cache_dir=CORPUS_CACHE_DIR,
+                                manifest_file=MANIFEST_FILE, workers=PREPROCESS_WORKERS):
+    """按文件缓存清洗和分词结果，只处理新增或改动的语料，最后按顺序拼接成分词文件。
+
+    清单以路径为键，记录大小、修改时间和内容摘要；大小和修改时间都没变时不再计算摘要。
+    缓存文件以内容摘要命名，文件改名或移动后仍可复用。拼接结果与完整重建逐字节一致。
+    清洗参数变化时全部重做；只有分词参数（后端、词表、停用词）变化时，从已缓存的 .clean.txt 重新分词。
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(manifest_file)
+    params = _cache_params(max_length)
+    old_params = manifest.get('params')
+    if not (isinstance(old_params, dict) and old_params.get('clean') == params['clean']):
+        manifest = {'files': {}}
+    manifest['params'] = params
+    # 每个条目记录生成其 .seg.txt 时的分词参数摘要，与当前不同时只复用 .clean.txt
+    segment_key = hashlib.blake2b(json.dumps(params['segment'], sort_keys=True).encode('utf-8'),
+                                  digest_size=8).hexdigest()
+    old_entries = manifest['files']
+    known_digests = {entry['digest'] for entry in old_entries.values()}
+    segmented_digests = {entry['digest'] for entry in old_entries.values() if entry.get('segment') == segment_key}
+
+    entries = {}
+    reused = resegmented = 0
+    for file_path in iter_corpus_files(input_dirs):
+        stat = os.stat(file_path)
+        entry = old_entries.get(file_path)
+        if not (entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns):
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': file_digest(file_path)}
+        digest = entry['digest']
+        entries[file_path] = entry = {**entry, 'segment': segment_key}
+
+        cleaned_file = os.path.join(cache_dir, f'{digest}.clean.txt')
+        segmented_file = os.path.join(cache_dir, f'{digest}.seg.txt')
+        if digest in segmented_digests and os.path.exists(segmented_file):
+            reused += 1
+            continue
+
+        if digest in known_digests and os.path.exists(cleaned_file):
+            print(f"分词参数已变化，从清洗缓存重新分词：{file_path}")
+            resegmented += 1
+        else:
+            print(f"处理新增或改动的语料：{file_path}")
+            clean_files([file_path], cleaned_file, max_length, workers=workers)
+        segment_corpus(cleaned_file, segmented_file + '.tmp')
+        os.replace(segmented_file + '.tmp', segmented_file)
+        known_digests.add(digest)
+        segmented_digests.add(digest)
+        manifest['files'] = {**old_entries, **entries}
+        save_manifest(manifest, manifest_file)
+
+    manifest['files'] = entries
+    save_manifest(manifest, manifest_file)
+    print(f"语料缓存：复用 {reused} 个文件，从清洗缓存重新分词 {resegmented} 个文件，"
+          f"重新处理 {len(entries) - reused - resegmented} 个文件")
+
+    # 清理不再被引用的缓存
+    live = {f"{entry['digest']}{suffix}" for entry in entries.values() for suffix in ('.clean.txt', '.seg.txt')}
+    for name in os.listdir(cache_dir):
+        if name.endswith(('.clean.txt', '.seg.txt')) and name not in live:
+            os.remove(os.path.join(cache_dir, name))
+
+    with open_corpus(output_file, 'wb') as f_out:
+        for entry in entries.values():
+            with open(os.path.join(cache_dir, f"{entry['digest']}.seg.txt"), 'rb') as f_in:
+                shutil.copyfileobj(f_in, f_out, 16 * 1024 * 1024)
+    print(f"分词结果已拼接：{output_file}")
 
 # ========== 生成 ARPA 文件 ==========
-def generate_arpa(segmented_file, arpa_file, ngram_order=3):
-    """调用 KenLM 生成 ARPA 文件，并使用指定的用户临时缓存目录。"""
-    # 使用 ~/ARPAtmp 目录，并确保它存在
-    tmp_dir = os.path.expanduser("~/ARPAtmp")
+LMPLZ_STEP_PATTERN = re.compile(r'=== (\d+)/(\d+) (.+?) ===')  # lmplz 的步骤标题，如 "=== 1/5 Counting and sorting n-grams ==="
+
+def available_memory_bytes():
+    """当前可用物理内存（字节），无法获取时返回 None。"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):  # Windows 没有 sysconf
+        return None
+
+def lmplz_memory_arg(fraction=LMPLZ_MEMORY_FRACTION):
+    """按可用内存计算 lmplz 的 -S 参数。"""
+    available = available_memory_bytes()
+    if not available:
+        return LMPLZ_FALLBACK_MEMORY
+    return f"{max(LMPLZ_MIN_MEMORY_MB, int(available * fraction / 1024 / 1024))}M"
 
-    if not os.path.exists(tmp_dir):
-        os.makedirs(tmp_dir)
-        print(f"已创建临时目录：{tmp_dir}")
+def lmplz_command(ngram_order, arpa_file, tmp_dir, memory, prune=NGRAM_PRUNE, text_file=None):
+    """构造 lmplz 的参数列表；text_file 为 None 时从标准输入读取分词文本。"""
+    cmd = ['lmplz', '-o', str(ngram_order), '--arpa', arpa_file, '-T', tmp_dir, '-S', memory]
+    if text_file is not None:
+        cmd += ['--text', text_file]
+    prune = [str(threshold) for threshold in list(prune)[:ngram_order]]
+    if prune:
+        cmd += ['--prune', *prune]  # 阈值个数不能超过阶数
+    return cmd
 
+def _read_lmplz_progress(stream, report, tail, start):
+    """后台线程：转发 lmplz 的标准错误输出，按步骤标题记录各步骤的起止时间。"""
+    steps = report['steps']
+    for raw in stream:
+        line = raw.decode('utf-8', 'replace')
+        sys.stderr.write(line)
+        tail.append(line)
+        line = line.strip()
+        now = time.perf_counter() - start
+        match = LMPLZ_STEP_PATTERN.fullmatch(line)
+        if match:
+            if steps:
+                steps[-1]['seconds'] = round(now - steps[-1]['start'], 3)
+            steps.append({'step': int(match.group(1)), 'total': int(match.group(2)),
+                          'title': match.group(3), 'start': round(now, 3)})
+        elif line.startswith('Name:lmplz'):
+            # 结束时的资源统计，如 "Name:lmplz\tVmPeak:...\tRSSMax:...\tuser:...\treal:..."
+            report['stats'] = dict(field.split(':', 1) for field in line.split('\t') if ':' in field)
+
+def _feed_lmplz(stdin, source):
+    """把分词文本写入 lmplz 的标准输入：source 为（可能压缩的）文件路径，或逐块返回文本的迭代器。"""
+    if isinstance(source, (str, os.PathLike)):
+        with open_corpus(source, 'rb') as f_in:
+            shutil.copyfileobj(f_in, stdin, 1024 * 1024)
+        return
+    for text in source:
+        stdin.write(text.encode('utf-8'))
+
+def run_lmplz(cmd, source=None):
+    """运行 lmplz 并返回报告 {'seconds', 'steps', 'stats'}；source 不为 None 时流式写入标准输入。
+
+    标准错误在后台线程中读取，避免 lmplz 输出过多时与写标准输入互相阻塞。
+    """
+    start = time.perf_counter()
+    report = {'steps': [], 'stats': {}}
+    tail = deque(maxlen=20)
+    try:
+        proc = subprocess.Popen(cmd, stdin=None if source is None else subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError(f"找不到 {cmd[0]}，请先安装 KenLM 并把 lmplz 加入 PATH") from None
+    reader = threading.Thread(target=_read_lmplz_progress, args=(proc.stderr, report, tail, start), daemon=True)
+    reader.start()
     try:
-        # 构建 lmplz 命令并指定缓存目录
-        cmd = (
-            f"lmplz -o {ngram_order} "
-            f"--text {segmented_file} "
-            f"--arpa {arpa_file} "
-            f"-T {tmp_dir} "
-            f"-S 4G "   # 分配 4G 内存用于排序（根据需要调整）
-            f"--prune 0 75 300"    #枝剪系数，分别代表1-4级需要过滤调的低于多少得词频1级不过滤，所以2、3、4分别过滤到词频低于1、2、3的数据
-        )
+        if source is not None:
+            try:
+                _feed_lmplz(proc.stdin, source)
+            except BrokenPipeError:
+                pass  # lmplz 提前退出，退出代码在下面检查
+            finally:
+                if hasattr(source, 'close'):
+                    source.close()  # 停止上游的分词进程
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+        exit_code = proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    reader.join()
 
-        print(f"执行命令：{cmd}")
-        exit_code = os.system(cmd)
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    steps = report['steps']
+    if steps and 'seconds' not in steps[-1]:
+        steps[-1]['seconds'] = round(report['seconds'] - steps[-1]['start'], 3)
+    if exit_code != 0:
+        raise RuntimeError(f"生成 ARPA 文件失败，退出代码: {exit_code}\n{''.join(tail)}")
+    return report
 
-        if exit_code != 0:
-            raise RuntimeError(f"生成 ARPA 文件失败，退出代码: {exit_code}")
+def print_lmplz_report(report):
+    print(f"{'步骤':<8}{'耗时(秒)':>10}  说明")
+    for step in report['steps']:
+        print(f"{step['step']}/{step['total']:<6}{step['seconds']:>10}  {step['title']}")
+    print(f"lmplz 总耗时 {report['seconds']} 秒" +
+          (f"，峰值内存 {report['stats']['RSSMax']}" if 'RSSMax' in report['stats'] else ''))
 
-        print(f"ARPA 文件生成完成：{arpa_file}")
+def generate_arpa(segmented, arpa_file, ngram_order=3, prune=NGRAM_PRUNE, tmp_root=LMPLZ_TMP_DIR):
+    """调用 KenLM 的 lmplz 生成 ARPA 文件，返回 run_lmplz 的报告。
 
+    segmented 为分词文件路径，或逐块返回分词文本的迭代器（直接写入 lmplz 标准输入，不落盘）；
+    未压缩的文件用 --text 直接读取，压缩文件解压后写入标准输入。
+    -S 按可用内存计算，剪枝阈值取自 prune；临时文件放在 tmp_root 下本次运行独立的子目录中，结束后删除。
+    """
+    os.makedirs(tmp_root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='lmplz_', dir=tmp_root)
+    try:
+        from_file = isinstance(segmented, (str, os.PathLike))
+        text_file = segmented if from_file and not compression_of(segmented) else None
+        cmd = lmplz_command(ngram_order, arpa_file, tmp_dir, lmplz_memory_arg(), prune, text_file)
+        print(f"执行命令：{' '.join(map(str, cmd))}")
+        report = run_lmplz(cmd, None if text_file is not None else segmented)
     finally:
-        # 在程序完成后删除临时目录及其内容
+        # 只删除本次运行的子目录
         clean_temp_directory(tmp_dir)
 
+    print_lmplz_report(report)
+    print(f"ARPA 文件生成完成：{arpa_file}")
+    return report
+
 def clean_temp_directory(tmp_dir):
     """删除临时目录及其所有内容。"""
     if os.path.exists(tmp_dir):
@@ -161,7 +717,7 @@ def extract_ngram_counts(arpa_file):
     """从 ARPA 文件中提取 n-gram 计数。"""
     ngrams_counts = {}
     try:
-        with open(arpa_file, 'r', encoding='utf-8') as file:
+        with open_corpus(arpa_file) as file:
             for line in file:
                 line = line.strip()
                 # 匹配 n-gram 计数行，如 "ngram 1=1000"
@@ -181,7 +737,7 @@ def extract_ngram_counts(arpa_file):
 def extract_ngrams(arpa_file):
     """从 ARPA 文件中提取 n-grams。"""
     ngram_line_pattern = re.compile(r"^(-?\d+\.\d+)\t(.+?)(?:\t-?\d+\.\d+)?$")
-    with open(arpa_file, 'r', encoding='utf-8') as file:
+    with open_corpus(arpa_file) as file:
         current_order = 0
         for line in file:
             line = line.strip()
@@ -196,141 +752,685 @@ def extract_ngrams(arpa_file):
                 yield current_order, ngram.strip(), prob  # 确保生成器返回三个值
 
 
-# ========== 写入频率文件 ==========
-def write_frequencies_to_file(ngrams_counts, arpa_file, filename_template):
-    """将 n-gram 数据块写入文件。"""
-    ngrams_generator = extract_ngrams(arpa_file)
-    current_order = 0
-    file = None
+# ========== 单遍读取 ARPA ==========
+ARPA_BLOCK_LINES = 100000  # 每个记录块的行数
+
+def read_arpa(arpa_file, block_lines=ARPA_BLOCK_LINES):
+    """单遍读取 ARPA 文件，返回 (各阶计数, 记录块生成器)。
+
+    头部（ngram N=计数）在返回前读完，同一个文件句柄接着读正文；正文按阶分块，
+    每块为 (阶数, n-gram 列表, 概率列表)，同一块内的阶数相同。
+    每行按制表符切分，不再逐行跑正则；概率按块用 map(math.exp, ...) 批量换算。
+    与 extract_ngrams 一致：对数概率按 math.exp 换算，且只接受带小数点的对数概率
+    （原正则 -?\d+\.\d+ 会跳过 <s> 的 -99）。
+    """
+    file = open_corpus(arpa_file)
+    ngrams_counts = {}
+    order = 0
+    try:
+        for line in file:
+            if line.startswith('ngram '):
+                key, _, value = line.partition('=')
+                ngrams_counts[int(key.split()[1])] = int(value)
+            elif line.startswith('\\') and '-grams:' in line:
+                order = int(line.split('-')[0][1:])
+                break
+    except BaseException:
+        file.close()
+        raise
+    return ngrams_counts, _closing_blocks(file, order, block_lines)
+
+def _closing_blocks(file, order, block_lines):
+    with file:
+        yield from _arpa_blocks(file, order, block_lines)
 
-    for order, ngram, prob in ngrams_generator:
-        if order != current_order:
-            if file:
-                file.close()
-            current_order = order
-            filename = filename_template.format(order)
-            file = open(filename, 'w', encoding='utf-8')
-            print(f"Writing {current_order}-grams to {filename}")
+def _arpa_blocks(lines, order, block_lines, single_section=False):
+    """read_arpa 的正文部分：逐块返回 (阶数, n-gram 列表, 概率列表)；lines 为正文的行迭代器。
 
-        total_count = ngrams_counts.get(order, 1)
-        freq = round(prob * total_count)
+    single_section=True 时只读当前这一阶，遇到下一个标题行即停止。
+    """
+    ngrams, logprobs = [], []
 
-        if not ngram or freq is None:
-            print(f"跳过无效频率行：{ngram} {freq}")
+    def flush():
+        block = (order, ngrams[:], list(map(math.exp, map(float, logprobs))))
+        ngrams.clear()
+        logprobs.clear()
+        return block
+
+    add_ngram, add_logprob = ngrams.append, logprobs.append
+    for line in lines:
+        if line[:1] == '\\':
+            if ngrams:
+                yield flush()
+            if single_section:
+                return
+            if '-grams:' in line:
+                order = int(line.split('-')[0][1:])
+            continue
+        parts = line.split('\t')
+        if len(parts) < 2 or '.' not in parts[0]:
+            continue  # 空行或 <s> 的 -99 等不带小数点的对数概率
+        ngram = parts[1].strip()
+        if not ngram:
+            print(f"跳过无效频率行：{line.strip()}")
             continue
+        add_logprob(parts[0])
+        add_ngram(ngram)
+        if len(ngrams) >= block_lines:
+            yield flush()
+    if ngrams:
+        yield flush()
 
-        file.write(f"{ngram}\t{freq}\n")
+# ========== 按阶定位 ARPA ==========
+def index_arpa_sections(arpa_file):
+    """在未压缩的 ARPA 文件中定位各阶正文，返回 (各阶计数, {阶数: 该阶第一行的字节偏移})。
 
-    if file:
-        file.close()
+    用 mmap 在文件中直接查找 "\\N-grams:" 标题行，不逐行读取。
+    """
+    ngrams_counts, offsets = {}, {}
+    if not os.path.getsize(arpa_file):
+        return ngrams_counts, offsets
+    with open(arpa_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        body = data.find(b'\\1-grams:')
+        if body < 0:
+            return ngrams_counts, offsets
+        for line in data[:body].decode('utf-8').splitlines():
+            if line.startswith('ngram '):
+                key, _, value = line.partition('=')
+                ngrams_counts[int(key.split()[1])] = int(value)
+        position = body
+        for order in sorted(ngrams_counts):
+            header = data.find(f'\\{order}-grams:'.encode(), position)
+            if header < 0:
+                break
+            position = data.find(b'\n', header) + 1
+            offsets[order] = position
+    return ngrams_counts, offsets
+
+def _write_order_frequencies(task):
+    """子进程：从字节偏移处读取一阶的正文，换算频次后写入该阶的频率文件，返回写入条数。"""
+    arpa_file, order, offset, total_count, filename = task
+    written = 0
+    with open(arpa_file, 'r', encoding='utf-8') as f_in, open_corpus(filename, 'w') as f_out:
+        f_in.seek(offset)
+        for _, ngrams, probs in _arpa_blocks(f_in, order, ARPA_BLOCK_LINES, single_section=True):
+            f_out.writelines([f"{ngram}\t{round(prob * total_count)}\n" for ngram, prob in zip(ngrams, probs)])
+            written += len(ngrams)
+    return written
+
+# ========== 写入频率文件 ==========
+FREQUENCY_WORKERS = 3  # 各阶频率文件并行写出的进程数（每阶一个进程），1 表示单进程顺序读取
+
+def write_frequencies_to_file(ngrams_counts, arpa_file, filename_template, workers=FREQUENCY_WORKERS):
+    """将 n-gram 数据块写入文件；ngrams_counts 为 None 时使用 ARPA 头部的计数。
+
+    workers > 1 且 ARPA 未压缩时，先定位各阶正文的字节偏移，每阶交给一个子进程独立换算写出；
+    压缩的 ARPA 无法按偏移跳转，按顺序单遍读取。
+    """
+    if workers > 1 and not compression_of(arpa_file):
+        header_counts, offsets = index_arpa_sections(arpa_file)
+        if ngrams_counts is None:
+            ngrams_counts = header_counts
+        tasks = [(arpa_file, order, offset, ngrams_counts.get(order, 1), filename_template.format(order))
+                 for order, offset in sorted(offsets.items())]
+        # 条数最多的阶（通常是最高阶）先提交，避免它最后才开始
+        tasks.sort(key=lambda task: header_counts.get(task[1], 0), reverse=True)
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks) or 1)) as executor:
+            for task, written in zip(tasks, executor.map(_write_order_frequencies, tasks)):
+                print(f"Writing {task[1]}-grams to {task[4]}：{written} 条")
+        return
+
+    header_counts, blocks = read_arpa(arpa_file)
+    if ngrams_counts is None:
+        ngrams_counts = header_counts
+    current_order = 0
+    file = None
+
+    try:
+        for order, ngrams, probs in blocks:
+            if order != current_order:
+                if file:
+                    file.close()
+                current_order = order
+                filename = filename_template.format(order)
+                file = open_corpus(filename, 'w')
+                print(f"Writing {current_order}-grams to {filename}")
+
+            total_count = ngrams_counts.get(order, 1)
+            file.writelines([f"{ngram}\t{round(prob * total_count)}\n" for ngram, prob in zip(ngrams, probs)])
+    finally:
+        if file:
+            file.close()
 # ========== 合并 n-gram 文件 ==========
-def merge_ngram_files(file_list, output_file, batch_size=20000):
-    """合并多个 n-gram 文件，并将结果写入一个输出文件，支持流式处理降低内存占用。"""
-    word_map = defaultdict(int)  # 词频计数
+MERGE_SPILL_ENTRIES = 5_000_000  # 合并时内存中的词条数超过此值就排序落盘为一个 run
+
+def iter_merge_entries(file_name):
+    """逐条返回 n-gram 文件中参与合并的 (词, 频次)：n-gram 去掉空格，<s> 去掉、</s> 换成 $，只保留 2-8 字的词。"""
     contains_keywords = ['<unk>']  # 需要过滤的关键词
+    with open_corpus(file_name) as file:
+        for line in tqdm(file, desc=f"读取 {file_name}", unit='行'):
+            line = line.strip()
 
-    def write_batch_to_file(f_out, batch):
-        """将一个批次的词频数据写入文件。"""
-        for word, freq in sorted(batch.items()):
-            f_out.write(f"{word}\t{freq}\n")
+            # 跳过包含指定关键词或无效的行
+            if any(keyword in line for keyword in contains_keywords):
+                continue
+            if not line or line.startswith('#') or '\t' not in line:
+                continue
+
+            # 解析行数据
+            try:
+                parts = line.split('\t')
+                if len(parts) < 2:
+                    continue
 
-    total_files = len(file_list)
-    
-    # 打开输出文件
-    with open(output_file, 'w', encoding='utf-8') as f_out:
-        # 遍历所有 n-gram 文件
-        for file_index, file_name in enumerate(file_list, 1):
-            if not os.path.exists(file_name):
-                print(f"错误：文件 {file_name} 不存在，跳过...")
+                word = parts[0].replace(" ", "").replace("<s>", "").replace("</s>", "$")
+                freq = int(parts[-1])
+            except ValueError as e:
+                print(f"跳过解析错误的行：{line} - {e}")
                 continue
 
-            print(f"[{file_index}/{total_files}] 正在处理文件：{file_name}")
+            # 过滤掉长度不符合条件的词
+            if 1 < len(word) <= 8:
+                yield word, freq
+
+def existing_ngram_files(file_list):
+    """按顺序返回存在的 (阶数, 文件名)，不存在的文件报错后跳过。"""
+    for order, file_name in enumerate(file_list, 1):
+        if not os.path.exists(file_name):
+            print(f"错误：文件 {file_name} 不存在，跳过...")
+            continue
+        print(f"[{order}/{len(file_list)}] 正在处理文件：{file_name}")
+        yield order, file_name
+
+def write_merged(items, output_file):
+    """把按词排序的 (词, 频次) 写入合并文件，返回词数。"""
+    written = 0
+    with open_corpus(output_file, 'w') as f_out:
+        for word, freq in items:
+            f_out.write(f"{word}\t{freq}\n")
+            written += 1
+    return written
+
+def merge_counter(file_list, run_dir, spill_entries=MERGE_SPILL_ENTRIES):
+    """读取各阶 n-gram 文件，返回累加好的 RunCounter（run 文件放在 run_dir 中）。"""
+    counter = RunCounter(run_dir, 'merge', spill_entries)
+    for _, file_name in existing_ngram_files(file_list):
+        for word, freq in iter_merge_entries(file_name):
+            counter.add(word, freq)
+    return counter
 
-            # 获取文件行数以显示进度条
-            total_lines = sum(1 for _ in open(file_name, 'r', encoding='utf-8'))
+def merge_ngram_files(file_list, output_file, spill_entries=MERGE_SPILL_ENTRIES, tmp_dir=None):
+    """合并多个 n-gram 文件，每个词只输出一行（各文件中的频次累加），按词排序。
+
+    词条在内存中累加，超过 spill_entries 时排序后落盘为有序的 run 文件，
+    最后对所有 run 做多路归并并累加相同的词，内存占用不随语料规模增长；每个输入文件只读一遍。
+    """
+    run_dir = tempfile.mkdtemp(prefix='merge_runs_', dir=tmp_dir)
+    try:
+        counter = merge_counter(file_list, run_dir, spill_entries)
+        written = write_merged(counter.items(), output_file)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
 
-            # 逐行读取文件，显示进度条
-            with open(file_name, 'r', encoding='utf-8') as file:
-                for line in tqdm(file, total=total_lines, desc=f"读取 {file_name}"):
-                    line = line.strip()
+    print(f"合并完成：{output_file}（{written} 个词，{len(counter.runs)} 个 run）")
+# ========== 生成 .gram 文件 ==========
+GRAM_BUILD_WORKERS = 3       # 同时运行的 build_grammar 进程数
+GRAM_STREAM_INPUT = False    # 合并结果直接写入 build_grammar 的标准输入，不写出 merge1_2_3.txt、merge_n3m1.txt 等
+GRAM_FEED_LINES = 10000      # 流式输入时每次写入标准输入的行数
 
-                    # 跳过包含指定关键词或无效的行
-                    if any(keyword in line for keyword in contains_keywords):
-                        continue
-                    if not line or line.startswith('#') or '\t' not in line:
-                        continue
+# 一次 .gram 构建：source 为合并文件路径（可压缩），或按词排序的 (词, 频次) 迭代器
+GramBuild = namedtuple('GramBuild', ['language', 'source'])
 
-                    # 解析行数据
-                    try:
-                        parts = line.split('\t')
-                        if len(parts) < 2:
-                            continue
+def gram_file_name(language):
+    return f"wanxiang-lts-{language}.gram"
 
-                        word = parts[0].replace(" ", "").replace("<s>", "").replace("</s>", "$")
-                        freq = int(parts[-1])
+def _feed_build_grammar(stdin, source):
+    """把合并结果写入 build_grammar 的标准输入。"""
+    if isinstance(source, (str, os.PathLike)):
+        with open_corpus(source, 'rb') as f_in:
+            shutil.copyfileobj(f_in, stdin, 1024 * 1024)
+        return
+    source = iter(source)
+    for block in iter(lambda: list(islice(source, GRAM_FEED_LINES)), []):
+        stdin.write(''.join([f"{word}\t{freq}\n" for word, freq in block]).encode('utf-8'))
 
-                        # 过滤掉长度不符合条件的词
-                        if not (1 < len(word) <= 8):
-                            continue
+def _run_gram_build(build):
+    """运行一次 build_grammar，成功时把 {language}.gram 重命名为最终文件名，返回报告。"""
+    start = time.perf_counter()
+    # 未压缩的合并文件直接作为标准输入，由子进程自己读取
+    direct = isinstance(build.source, (str, os.PathLike)) and not compression_of(build.source)
+    try:
+        with open(build.source, 'rb') if direct else contextlib.nullcontext(subprocess.PIPE) as stdin:
+            proc = subprocess.Popen(['./build_grammar', build.language], stdin=stdin)
+    except FileNotFoundError as e:
+        raise RuntimeError(f"找不到 {e.filename}，请确认 build_grammar 和合并文件都在当前目录") from None
+    try:
+        if not direct:
+            try:
+                _feed_build_grammar(proc.stdin, build.source)
+            except BrokenPipeError:
+                pass  # build_grammar 提前退出，退出代码在下面检查
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+        exit_code = proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
 
-                        # 累加词频
-                        word_map[word] += freq
+    report = {'language': build.language, 'exit_code': exit_code, 'seconds': round(time.perf_counter() - start, 3)}
+    if exit_code == 0:
+        # 重命名文件，标记为完成
+        final_name = gram_file_name(build.language)
+        os.replace(f"{build.language}.gram", final_name)
+        report.update(output=final_name, size_mb=round(os.path.getsize(final_name) / 1024 / 1024, 2))
+    return report
 
-                    except ValueError as e:
-                        print(f"跳过解析错误的行：{line} - {e}")
-                        continue
+def run_gram_builds(builds, workers=GRAM_BUILD_WORKERS):
+    """同时运行若干个 build_grammar（每个构建一个子进程），全部结束后检查退出代码，返回各构建的报告。
 
-                    # 达到批次大小时，写入文件并清空缓冲区
-                    if len(word_map) >= batch_size:
-                        write_batch_to_file(f_out, word_map)
-                        word_map.clear()
+    子进程并行运行；主进程中每个构建占一个线程，只负责往标准输入写数据和等待退出。
+    """
+    if not builds:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(builds)))) as executor:
+        reports = list(executor.map(_run_gram_build, builds))
 
-        # 写入剩余数据
-        if word_map:
-            write_batch_to_file(f_out, word_map)
+    print(f"{'语言':<24}{'退出代码':>8}{'耗时(秒)':>10}{'大小(MB)':>10}  输出")
+    for report in reports:
+        print(f"{report['language']:<24}{report['exit_code']:>8}{report['seconds']:>10}"
+              f"{report.get('size_mb', ''):>10}  {report.get('output', '')}")
+    failed = [report for report in reports if report['exit_code'] != 0]
+    if failed:
+        raise RuntimeError("生成 .gram 文件失败：" +
+                           "，".join(f"{report['language']}（退出代码 {report['exit_code']}）" for report in failed))
+    return reports
 
-    print(f"合并完成：{output_file}")
-# ========== 生成 .gram 文件 ==========
 def generate_gram_file(merged_file, language):
-    # 生成带语言和自定义名称的 .gram 文件
-    cmd = f"./build_grammar {language} < {merged_file}"
-    exit_code = os.system(cmd)
-    if exit_code != 0:
-        raise RuntimeError(f"生成 .gram 文件失败，退出代码: {exit_code}")
-    
-    # 重命名文件，标记为完成
-    final_name = f"wanxiang-lts-{language}.gram"
-    os.rename(f"{language}.gram", final_name)
-    print(f".gram 文件已生成并重命名为：{final_name}")
+    """生成带语言和自定义名称的 .gram 文件。"""
+    report, = run_gram_builds([GramBuild(language, merged_file)], workers=1)
+    print(f".gram 文件已生成并重命名为：{report['output']}")
+
+def merge_to_gram(file_list, language, spill_entries=MERGE_SPILL_ENTRIES, tmp_dir=None, lexicon_file=None):
+    """与 merge_ngram_files 相同地合并各阶 n-gram，结果直接写入 build_grammar 的标准输入，不写出合并文件。
+
+    lexicon_file 不为 None 时，同一遍合并的结果同时写入分词词库（格式与合并文件相同），
+    .gram 构建成功后才替换原有的词库。
+    """
+    run_dir = tempfile.mkdtemp(prefix='merge_runs_', dir=tmp_dir)
+    tmp_file = None if lexicon_file is None else lexicon_file + '.tmp'
+    try:
+        counter = merge_counter(file_list, run_dir, spill_entries)
+        if tmp_file is None:
+            run_gram_builds([GramBuild(language, counter.items())], workers=1)
+            return
+        with open(tmp_file, 'w', encoding='utf-8') as f_lexicon:
+            source = _tee_merged(counter.items(), f_lexicon)
+            run_gram_builds([GramBuild(language, source)], workers=1)
+            deque(source, maxlen=0)  # build_grammar 没有读完时补齐词库
+        commit_lexicon(tmp_file, lexicon_file)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)  # 构建失败时丢弃写了一半的词库
 
+def _tee_merged(items, f_out):
+    """逐条返回 (词, 频次)，同时按 write_merged 的格式成块写入 f_out。"""
+    items = iter(items)
+    for block in iter(lambda: list(islice(items, GRAM_FEED_LINES)), []):
+        f_out.write(''.join([f"{word}\t{freq}\n" for word, freq in block]))
+        yield from block
+
+# ========== 多档尺寸模型 ==========
+SizeTier = namedtuple('SizeTier', ['name', 'order', 'target_bytes', 'thresholds'])
+
+def tier_language(tier, base_language=None):
+    """档位对应的 build_grammar 语言名，如 zh-hans-n3m1。"""
+    return f"{base_language or language}-n{tier.order}{tier.name}"
+
+def ngram_size_histograms(file_list):
+    """读取各阶 n-gram 文件，返回每阶的 {频次: 参与合并的记录写入合并文件后的字节数}。"""
+    histograms = []
+    for order, file_name in enumerate(file_list, 1):
+        histogram = defaultdict(int)
+        if os.path.exists(file_name):
+            for word, freq in iter_merge_entries(file_name):
+                histogram[freq] += len(word.encode('utf-8')) + len(str(freq)) + 2
+        histograms.append(histogram)
+    return histograms
+
+def _suffix_sizes(histogram):
+    """(升序的频次列表, 对应的后缀字节和)，用于 O(log n) 求 "频次大于阈值" 的总字节数。"""
+    counts = sorted(histogram)
+    sizes = [0] * (len(counts) + 1)
+    for i in range(len(counts) - 1, -1, -1):
+        sizes[i] = sizes[i + 1] + histogram[counts[i]]
+    return counts, sizes
+
+def projected_size(suffixes, thresholds):
+    """按阈值剪枝后合并文件的预计字节数（不同阶合并成同一个词的情况忽略不计，结果偏大）。"""
+    total = 0
+    for (counts, sizes), threshold in zip(suffixes, thresholds):
+        total += sizes[bisect.bisect_right(counts, threshold)]
+    return total
+
+def choose_tier_thresholds(suffixes, order, target_bytes, weights=SIZE_TIER_WEIGHTS):
+    """二分查找最高阶的阈值 t，其余各阶取 t * 权重比例，得到预计大小不超过目标的最小阈值组合。
+
+    权重为 0 的阶（默认为 1 阶）从不剪枝：这些阶本身就超过目标时，返回剪掉所有可剪记录的阈值，
+    预计大小仍大于目标，由调用方检查。
+    """
+    weights = list(weights)[:order] + [1] * (order - len(weights))
+    top = weights[-1] or 1
+
+    def thresholds(t):
+        return tuple(t * weight // top for weight in weights)
+
+    suffixes = suffixes[:order]
+    if projected_size(suffixes, thresholds(0)) <= target_bytes:
+        return thresholds(0)
+    low, high = 0, max((counts[-1] for counts, _ in suffixes if counts), default=0) * top + 1
+    # 循环中 projected_size(low) > 目标；high 满足 目标 >= projected_size(high)，
+    # 或者仍是初始上界（所有可剪的记录都已剪掉，预计大小可能仍超过目标）
+    while high - low > 1:
+        middle = (low + high) // 2
+        if projected_size(suffixes, thresholds(middle)) <= target_bytes:
+            high = middle
+        else:
+            low = middle
+    return thresholds(high)
+
+def plan_size_tiers(file_list, tiers=SIZE_TIERS, orders=SIZE_TIER_ORDERS, size_ratio=GRAM_SIZE_RATIO):
+    """为每个 (阶数, 档位) 选定各阶剪枝阈值，返回 SizeTier 列表；阶数超过现有 n-gram 文件的组合跳过。
+
+    阈值作用于 file_list 中的频次：file_list 已经剪枝时，实际的剪枝效果是两者叠加。
+    """
+    suffixes = [_suffix_sizes(histogram) for histogram in ngram_size_histograms(file_list)]
+    plan = []
+    for order in orders:
+        if order > len(file_list):
+            print(f"警告：只有 {len(file_list)} 阶 n-gram，跳过 n{order} 的档位。")
+            continue
+        for name, target_mb in tiers.items():
+            target_bytes = int(target_mb * 1024 * 1024 / size_ratio)
+            thresholds = choose_tier_thresholds(suffixes, order, target_bytes)
+            plan.append(SizeTier(name, order, target_bytes, thresholds))
+            projected = projected_size(suffixes[:order], thresholds)
+            size_mb = projected * size_ratio / 1024 / 1024
+            print(f"n{order}{name}：剪枝阈值 {thresholds}，预计 {size_mb:.1f} MB（目标 {target_mb} MB）")
+            if projected > target_bytes:
+                print(f"警告：n{order}{name} 剪掉所有可剪的 n-gram 后仍超过目标大小，"
+                      f"请调大 SIZE_TIERS 中的目标或调整 SIZE_TIER_WEIGHTS。")
+    return plan
+
+def count_size_tiers(file_list, plan, run_dir, spill_entries=MERGE_SPILL_ENTRIES):
+    """单遍读取各阶 n-gram 文件，按每个档位的阈值把记录分发到各自的 RunCounter，返回与 plan 对应的计数器列表。
+
+    与 merge_ngram_files 相同：同一个词在各阶的频次累加，每个词一行。
+    """
+    counters = [RunCounter(run_dir, f"n{tier.order}{tier.name}", max(1, spill_entries // max(1, len(plan))))
+                for tier in plan]
+    for order, file_name in existing_ngram_files(file_list):
+        # 当前阶需要写入的档位及其阈值
+        targets = [(counter.add, tier.thresholds[order - 1])
+                   for tier, counter in zip(plan, counters) if order <= tier.order]
+        if not targets:
+            continue
+        for word, freq in iter_merge_entries(file_name):
+            for add, threshold in targets:
+                if freq > threshold:
+                    add(word, freq)
+    return counters
+
+def generate_size_tiers(file_list, merged_template, base_language=None, stream=GRAM_STREAM_INPUT, tmp_dir=None):
+    """按 SIZE_TIERS 规划各档阈值，单遍分发到各档，再并行运行各档的 build_grammar。
+
+    file_list 应为未剪枝的精确频次（见 TIER_NGRAM_FILE_TEMPLATE）；传入 NGRAM_FILES 时各档阈值叠加在 NGRAM_PRUNE 之上。
+    stream=True 时各档的合并结果直接写入对应 build_grammar 的标准输入，否则先写出 merged_template 对应的合并文件。
+    """
+    plan = plan_size_tiers(file_list)
+    run_dir = tempfile.mkdtemp(prefix='tier_runs_', dir=tmp_dir)
+    try:
+        builds = []
+        for tier, counter in zip(plan, count_size_tiers(file_list, plan, run_dir)):
+            source = counter.items()
+            if not stream:
+                merged_file = merged_template.format(f"n{tier.order}{tier.name}")
+                written = write_merged(source, merged_file)
+                print(f"n{tier.order}{tier.name} 合并完成：{merged_file}（{written} 个词，"
+                      f"{os.path.getsize(merged_file) / 1024 / 1024:.1f} MB）")
+                source = merged_file
+            builds.append(GramBuild(tier_language(tier, base_language), source))
+        return run_gram_builds(builds)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+# ========== 阶段调度 ==========
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs', 'params'])
+
+def path_fingerprint(path):
+    """文件记录 [大小, 修改时间]，目录记录其中每个文件的指纹，不存在时为 None。"""
+    if os.path.isdir(path):
+        return {os.path.relpath(os.path.join(root, file), path): path_fingerprint(os.path.join(root, file))
+                for root, _, files in sorted(os.walk(path)) for file in sorted(files)}
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    return None
+
+def _reset_peak_rss():
+    """重置本进程的峰值内存统计（Linux 4.0+），不支持时返回 False。"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+RUSAGE_SCALE = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss 在 macOS 上单位为字节，Linux 为 KB
+
+def _peak_rss_mb(resettable):
+    """返回 (本进程峰值, 已结束子进程中的最大峰值)，单位 MB；无法按阶段重置时本进程峰值为整个运行期间的峰值。"""
+    if resource is None:
+        return 0.0, 0.0
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RUSAGE_SCALE
+    if resettable:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    self_peak = int(line.split()[1]) / 1024
+    return self_peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / RUSAGE_SCALE
+
+def run_stages(stages, state_file=STAGE_STATE_FILE, report_file=STAGE_REPORT_FILE, start_stage=None, force=False):
+    """按顺序执行各阶段，跳过输入指纹、参数和输出都没有变化的阶段。
+
+    start_stage 指定从哪个阶段开始：之前的阶段直接跳过（沿用已有输出），该阶段及之后的阶段强制重新执行。
+    每个阶段成功后立即保存状态，失败后可以从失败的阶段续跑。
+    """
+    names = [stage.name for stage in stages]
+    if start_stage is not None and start_stage not in names:
+        raise ValueError(f"未知的阶段：{start_stage}，可选：{' / '.join(names)}")
+
+    state = load_manifest(state_file)
+    report = []
+    reached = start_stage is None
+    try:
+        for stage in stages:
+            if not reached and stage.name != start_stage:
+                print(f"[{stage.name}] 从 {start_stage} 开始，跳过")
+                report.append({'stage': stage.name, 'status': 'resumed'})
+                continue
+            reached = True
+            # 指定了起始阶段时，它和之后的阶段都不看指纹，全部重新执行
+            rerun = force or start_stage is not None
+
+            inputs = {path: path_fingerprint(path) for path in stage.inputs}
+            record = state.get(stage.name)
+            if (not rerun and record
+                    and record['inputs'] == inputs and record['params'] == stage.params
+                    and record['outputs'] == {path: path_fingerprint(path) for path in stage.outputs}):
+                print(f"[{stage.name}] 输入和输出均未变化，跳过")
+                report.append({'stage': stage.name, 'status': 'up-to-date'})
+                continue
+
+            print(f"[{stage.name}] 开始执行...")
+            resettable = _reset_peak_rss()
+            children_before = _peak_rss_mb(False)[1]
+            start_time = time.perf_counter()
+            stage.func()
+            elapsed = time.perf_counter() - start_time
+            self_peak, children_peak = _peak_rss_mb(resettable)
+            # RUSAGE_CHILDREN 是整个运行期间所有子进程的最大值，无法重置：
+            # 只有本阶段把它抬高时，新值才是本阶段子进程的峰值，否则不记录
+            children_peak = round(children_peak, 1) if children_peak > children_before else None
+
+            missing = [path for path in stage.outputs if path_fingerprint(path) is None]
+            if missing:
+                raise RuntimeError(f"阶段 {stage.name} 没有生成输出：{', '.join(missing)}")
+            state[stage.name] = {
+                'inputs': inputs,
+                'params': stage.params,
+                'outputs': {path: path_fingerprint(path) for path in stage.outputs},
+            }
+            save_manifest(state, state_file)
+            report.append({'stage': stage.name, 'status': 'done', 'seconds': round(elapsed, 2),
+                           'peak_rss_mb': round(self_peak, 1), 'children_peak_rss_mb': children_peak})
+    finally:
+        print_stage_report(report)
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    return report
+
+def print_stage_report(report):
+    print(f"{'阶段':<12}{'状态':<12}{'耗时(秒)':>10}{'峰值内存(MB)':>14}{'子进程峰值(MB)':>16}")
+    for item in report:
+        print(f"{item['stage']:<12}{item['status']:<12}{item.get('seconds', ''):>10}"
+              f"{item.get('peak_rss_mb', ''):>14}{_format_children_peak(item):>16}")
+
+def _format_children_peak(item):
+    """子进程峰值：未执行的阶段留空，执行了但没有抬高子进程峰值的阶段显示 —。"""
+    if item['status'] != 'done':
+        return ''
+    peak = item.get('children_peak_rss_mb')
+    return '—' if peak is None else peak
 
 # ========== 主函数 ==========
-def main(use_existing_segmentation=False, ngram_order=3):
-    """主程序：处理语料和 n-gram 数据。    """      
-    print("开始预处理语料...")
-    preprocess_corpus([RAW_CORPUS_DIR], PROCESSED_CORPUS_FILE)
+def build_stages(ngram_order=3, incremental=INCREMENTAL_BUILD):
+    """描述整个构建流程：每个阶段的执行函数、输入、输出和影响结果的参数。"""
+    ngram_files = NGRAM_FILES[:ngram_order]
+    stages = []
 
-    if not use_existing_segmentation:
-        print("开始分词处理...")
-        segment_corpus(PROCESSED_CORPUS_FILE, SEGMENTED_FILE)
+    def dedup_segmented():
+        # 增量和流式模式都不保留完整的清理后文件，只能在分词结果上去重
+        if DEDUP_ENABLED:
+            tmp_file = os.path.join(os.path.dirname(SEGMENTED_FILE), 'tmp_' + os.path.basename(SEGMENTED_FILE))
+            dedup_corpus(SEGMENTED_FILE, tmp_file)
+            os.replace(tmp_file, SEGMENTED_FILE)
 
+    # 流式输入时没有 segment 阶段：分词在 arpa 阶段内进行，结果直接写入 lmplz 的标准输入
+    stream = LMPLZ_STREAM_INPUT and NGRAM_COUNTER == 'lmplz'
+    if stream and (incremental or (FUSED_PIPELINE and DEDUP_ENABLED)):
+        print("提示：增量构建和在分词结果上去重都需要完整的分词文件，LMPLZ_STREAM_INPUT 不生效。")
+        stream = False
+    arpa_source, arpa_inputs, arpa_params = lambda: SEGMENTED_FILE, [SEGMENTED_FILE], {}
 
-    print("生成 ARPA 文件...")
-    generate_arpa(SEGMENTED_FILE, ARPA_FILE, ngram_order)
+    if incremental or FUSED_PIPELINE:
+        def segment():
+            if incremental:
+                build_segmented_incremental([RAW_CORPUS_DIR], SEGMENTED_FILE)
+            else:
+                preprocess_and_segment([RAW_CORPUS_DIR], SEGMENTED_FILE)
+            dedup_segmented()
+        segment_params = {'dedup': DEDUP_ENABLED and DEDUP_MODE, 'stopwords': STOPWORDS_ENABLED, **segmenter_params()}
+        if stream:
+            arpa_source = lambda: iter_preprocess_and_segment([RAW_CORPUS_DIR])
+            arpa_inputs, arpa_params = [RAW_CORPUS_DIR], segment_params
+        else:
+            stages.append(Stage('segment', segment, [RAW_CORPUS_DIR], [SEGMENTED_FILE], segment_params))
+    else:
+        stages.append(Stage('preprocess', lambda: preprocess_corpus([RAW_CORPUS_DIR], PROCESSED_CORPUS_FILE),
+                            [RAW_CORPUS_DIR], [PROCESSED_CORPUS_FILE], {}))
+        corpus_file = PROCESSED_CORPUS_FILE
+        if DEDUP_ENABLED:
+            stages.append(Stage('dedup', lambda: dedup_corpus(PROCESSED_CORPUS_FILE, DEDUPED_CORPUS_FILE),
+                                [PROCESSED_CORPUS_FILE], [DEDUPED_CORPUS_FILE], {'mode': DEDUP_MODE}))
+            corpus_file = DEDUPED_CORPUS_FILE
+        segment_params = {'stopwords': STOPWORDS_ENABLED, **segmenter_params()}
+        if stream:
+            arpa_source = lambda: iter_segment_corpus(corpus_file)
+            arpa_inputs, arpa_params = [corpus_file], segment_params
+        else:
+            stages.append(Stage('segment', lambda: segment_corpus(corpus_file, SEGMENTED_FILE),
+                                [corpus_file], [SEGMENTED_FILE], segment_params))
 
-    print("提取 n-gram 计数...")
-    # 确保这里的函数名称与定义的函数名称一致
-    ngrams_counts = extract_ngram_counts(ARPA_FILE)
+    def frequencies():
+        write_frequencies_to_file(None, ARPA_FILE, NGRAM_FILE_TEMPLATE)  # 单遍读取，计数取自 ARPA 头部
 
-    print("写入频率文件...")
-    write_frequencies_to_file(ngrams_counts, ARPA_FILE, NGRAM_FILE_TEMPLATE)
+    # 多档尺寸模型在未剪枝的精确频次上规划阈值；流式 lmplz 没有分词文件，只能用剪枝后的近似频次
+    tier_files = [TIER_NGRAM_FILE_TEMPLATE.format(i) for i in range(1, ngram_order + 1)]
+    if SIZE_TIERS_ENABLED and stream:
+        print("警告：LMPLZ_STREAM_INPUT 没有分词文件，多档尺寸模型只能在按 NGRAM_PRUNE 剪枝、"
+              "由 ARPA 换算的近似频次上规划，各档阈值叠加在 NGRAM_PRUNE 之上。")
+        tier_files = ngram_files
 
-    print("合并 n-gram 文件...")
-    merge_ngram_files(NGRAM_FILES, merged_file)
+    if NGRAM_COUNTER == 'native':
+        # 内建计数直接得到精确频次，省去 ARPA 的生成和解析；多档尺寸模型需要的未剪枝频次在同一遍中写出
+        full_template = TIER_NGRAM_FILE_TEMPLATE if SIZE_TIERS_ENABLED else None
+        stages.append(Stage('count', lambda: count_ngrams(SEGMENTED_FILE, NGRAM_FILE_TEMPLATE, ngram_order, NGRAM_PRUNE,
+                                                          full_template=full_template),
+                            [SEGMENTED_FILE], ngram_files + (tier_files if full_template else []),
+                            {'ngram_order': ngram_order, 'prune': list(NGRAM_PRUNE), 'full': bool(full_template)}))
+    else:
+        stages += [
+            Stage('arpa', lambda: generate_arpa(arpa_source(), ARPA_FILE, ngram_order, NGRAM_PRUNE),
+                  arpa_inputs, [ARPA_FILE], {'ngram_order': ngram_order, 'prune': list(NGRAM_PRUNE), **arpa_params}),
+            Stage('frequencies', frequencies, [ARPA_FILE], ngram_files, {}),
+        ]
+        if ARPA_INDEX_ENABLED:
+            stages.append(Stage('index', lambda: build_index(ARPA_FILE, ARPA_INDEX_FILE),
+                                [ARPA_FILE], [ARPA_INDEX_FILE], {}))
+    # 只有 native 分词读 分词词库.txt，jieba 后端不需要快照
+    snapshot = LEXICON_SNAPSHOT_ENABLED and SEGMENT_BACKEND == 'native'
+    if GRAM_STREAM_INPUT:
+        # 合并结果直接送入 build_grammar，不写出 merge1_2_3.txt；分词词库在同一遍合并中写出
+        lexicon_file = LEXICON_SNAPSHOT_FILE if snapshot else None
+        stages.append(Stage('gram', lambda: merge_to_gram(ngram_files, language, lexicon_file=lexicon_file),
+                            ngram_files, [gram_file_name(language)] + ([lexicon_file] if snapshot else []),
+                            {'language': language, 'lexicon': snapshot}))
+    else:
+        stages += [
+            Stage('merge', lambda: merge_ngram_files(ngram_files, merged_file), ngram_files, [merged_file], {}),
+            Stage('gram', lambda: generate_gram_file(merged_file, language),
+                  [merged_file], [gram_file_name(language)], {'language': language}),
+        ]
+    if snapshot and not GRAM_STREAM_INPUT:
+        # 排在 gram 之后：.gram 构建失败时不更新词表
+        stages.append(Stage('lexicon', lambda: snapshot_lexicon(merged_file), [merged_file], [LEXICON_SNAPSHOT_FILE], {}))
+    if SIZE_TIERS_ENABLED:
+        if NGRAM_COUNTER == 'lmplz' and not stream:
+            stages.append(Stage('tier_count', lambda: count_ngrams(SEGMENTED_FILE, TIER_NGRAM_FILE_TEMPLATE, ngram_order),
+                                [SEGMENTED_FILE], tier_files, {'ngram_order': ngram_order}))
+        tier_names = [f"n{order}{name}" for order in SIZE_TIER_ORDERS if order <= ngram_order for name in SIZE_TIERS]
+        stages.append(Stage('tiers',
+                            lambda: generate_size_tiers(tier_files, TIER_MERGED_TEMPLATE, stream=GRAM_STREAM_INPUT),
+                            tier_files, [gram_file_name(f"{language}-{name}") for name in tier_names],
+                            {'language': language, 'tiers': SIZE_TIERS, 'orders': list(SIZE_TIER_ORDERS),
+                             'weights': list(SIZE_TIER_WEIGHTS), 'size_ratio': GRAM_SIZE_RATIO}))
+    return stages
 
-    print("生成 .gram 文件...")
-    generate_gram_file(merged_file, language)
+def main(use_existing_segmentation=False, ngram_order=3, incremental=INCREMENTAL_BUILD, start_stage=None, force=False):
+    """主程序：处理语料和 n-gram 数据。
 
+    各阶段的输入没有变化时自动跳过；start_stage 可从任意阶段续跑（'preprocess' / 'dedup' / 'segment' /
+    'arpa' / 'frequencies' / 'index' / 'count' / 'merge' / 'gram' / 'lexicon' / 'tiers'），
+    use_existing_segmentation=True 等同于从分词之后的第一个阶段（'arpa'，NGRAM_COUNTER='native' 时为 'count'）开始。
+    """
+    if use_existing_segmentation and start_stage is None:
+        start_stage = 'count' if NGRAM_COUNTER == 'native' else 'arpa'
+    run_stages(build_stages(ngram_order, incremental), start_stage=start_stage, force=force)
     print("所有任务完成。")
 
 